@@ -1,5 +1,6 @@
 import React, { useEffect, useRef, useState } from 'react';
 import ChatMessage from './components/ChatMessage.jsx';
+import { loadDB, saveDB } from './utils/storage.js';
 const API_BASE = import.meta.env.VITE_API_BASE || "https://ledger-backend-c5t9.onrender.com";
 /* =====================================================================================
    Helpers
@@ -22,6 +23,10 @@ function hm(dtStr) {
 function startOfMonth(date = new Date()) {
   return new Date(date.getFullYear(), date.getMonth(), 1);
 }
+// Same folding as the server's names.name_key: case and runs of spaces don't make a different person
+function foldName(name){
+  return (name||'').normalize('NFKC').trim().split(/\s+/).join(' ').toLowerCase();
+}
 const MONTHS = { jan:1,feb:2,mar:3,apr:4,may:5,jun:6,jul:7,aug:8,sep:9,sept:9,oct:10,nov:11,dec:12 };
 function pad2(n){return n<10?`0${n}`:String(n)}
 function parseLooseDateToken(tok){
@@ -51,9 +56,24 @@ function parseInvoiceItem(line){
   return { description:m[1].trim(), price:parseFloat(m[2]), gstPercent:parseFloat(m[3]) };
 }
 async function apiCreateInvoice(payload){
-  return fetch(`${API_BASE}/api/invoices`,{
+  const r=await fetch(`${API_BASE}/api/invoices`,{
     method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify(payload)
   });
+  let data=null; try{ data=await r.json(); }catch{}
+  return {ok:r.ok, data};
+}
+// Rendering happens in the background; poll until the job is done or failed.
+async function apiWaitInvoice(id,timeoutMs=30000){
+  const t0=Date.now(); let delay=150;
+  while(Date.now()-t0<timeoutMs){
+    const r=await fetch(`${API_BASE}/api/invoices/${id}/status`);
+    if(!r.ok) return null;
+    const job=await r.json();
+    if(job.status!=='pending') return job;
+    await new Promise(res=>setTimeout(res,delay));
+    delay=Math.min(delay*2,1000);
+  }
+  return null;
 }
 
 /* =====================================================================================
@@ -71,11 +91,67 @@ async function apiRegister(mobile,name){
   });
   return r.ok;
 }
-async function apiListEntries(mobile){
-  const r=await fetch(`${API_BASE}/api/user/${mobile}/entries`);
-  if(!r.ok) return [];
-  const d=await r.json();
-  return d.items||[];
+async function apiListEntries(mobile,{from,to}={}){
+  // Follows next_cursor until the (optionally date-bounded) listing is exhausted.
+  const items=[];
+  let cursor=null;
+  do{
+    const qs=new URLSearchParams({limit:'1000'});
+    if(from) qs.set('from',from);
+    if(to) qs.set('to',to);
+    if(cursor) qs.set('cursor',cursor);
+    const r=await fetch(`${API_BASE}/api/user/${mobile}/entries?${qs}`);
+    if(!r.ok) return items;
+    const d=await r.json();
+    items.push(...(d.items||[]));
+    cursor=d.next_cursor||null;
+  }while(cursor);
+  return items;
+}
+async function apiGetSummary(mobile,from,to){
+  const qs=new URLSearchParams();
+  if(from) qs.set('from',from);
+  if(to) qs.set('to',to);
+  const r=await fetch(`${API_BASE}/api/user/${mobile}/summary?${qs}`);
+  if(!r.ok) return null;
+  return await r.json();
+}
+// kind: 'receivables' | 'payables' — outstanding balances with aging buckets
+async function apiGetBalances(mobile,kind){
+  const r=await fetch(`${API_BASE}/api/user/${mobile}/${kind}`);
+  if(!r.ok) return null;
+  return await r.json();
+}
+// Units sold per product over from..to (defaults to month-to-date); paged server-side
+async function apiGetInventory(mobile,{from,to,page,pageSize,sort}={}){
+  const qs=new URLSearchParams();
+  if(from) qs.set('from',from);
+  if(to) qs.set('to',to);
+  if(page) qs.set('page',String(page));
+  if(pageSize) qs.set('page_size',String(pageSize));
+  if(sort) qs.set('sort',sort);
+  const r=await fetch(`${API_BASE}/api/user/${mobile}/inventory?${qs}`);
+  if(!r.ok) return null;
+  return await r.json();
+}
+// Entries whose product/customer names have every word of q; ranked, paginated server-side
+async function apiSearchEntries(mobile,q,{from,to,page}={}){
+  const qs=new URLSearchParams({q});
+  if(from) qs.set('from',from);
+  if(to) qs.set('to',to);
+  if(page) qs.set('page',String(page));
+  const r=await fetch(`${API_BASE}/api/user/${mobile}/search?${qs}`);
+  if(!r.ok) return null;
+  return await r.json();
+}
+// Dashboard trends: daily revenue with 7/30-day averages, weekly change, top/declining products, top credit customers
+async function apiGetAnalytics(mobile,{asOf,days}={}){
+  const qs=new URLSearchParams();
+  if(asOf) qs.set('as_of',asOf);
+  if(days) qs.set('days',String(days));
+  const r=await fetch(`${API_BASE}/api/user/${mobile}/analytics?${qs}`);
+  if(!r.ok) return null;
+  return await r.json();
 }
 async function apiAddEntries(mobile,items){
   const r=await fetch(`${API_BASE}/api/user/${mobile}/entries`,{
@@ -84,11 +160,12 @@ async function apiAddEntries(mobile,items){
   });
   return r.ok;
 }
-async function apiParseLLM(text){
+// With mobile, creditor names come back spelled as that shop's ledger has them
+async function apiParseLLM(text,mobile){
   try{
     const r=await fetch(`${API_BASE}/api/parseMessage`,{
       method:'POST',headers:{'Content-Type':'application/json'},
-      body:JSON.stringify({message:text})
+      body:JSON.stringify({message:text,mobile})
     });
     const d=await r.json();
     if(!r.ok) return null;
@@ -102,6 +179,15 @@ async function apiParseLLM(text){
     return null;
   }catch{return null;}
 }
+// The ledger's spelling of a typed customer/vendor name ("ramesh sharmaa" → "Ramesh Sharma"); q itself if unknown
+async function apiMatchCounterparty(mobile,q){
+  try{
+    const r=await fetch(`${API_BASE}/api/user/${mobile}/counterparties/match?${new URLSearchParams({q})}`);
+    if(!r.ok) return q;
+    const d=await r.json();
+    return d.canonical||q;
+  }catch{return q;}
+}
 async function apiIngestInvoice(mobile,file){
   const fd=new FormData();
   fd.append('mobile',mobile);
@@ -122,9 +208,34 @@ async function apiUpdateSettings(mobile,payload){
   });
   return r.ok;
 }
+// Brings the locally stored copy of a shop's entries (utils/storage.js) up to date
+// from /changes: with nothing new that's one small request, not the whole ledger.
+// Returns newest-first entries, or null if the server couldn't be read.
+async function apiSyncEntries(mobile){
+  const db=loadDB();
+  // anything not in this shape (e.g. an older app's data under the same key) is dropped
+  const local=Number.isInteger(db[mobile]?.seq)&&Array.isArray(db[mobile].entries)?db[mobile]:{seq:0,entries:[]};
+  const byId=new Map(local.entries.map(e=>[e.id,e]));
+  let seq=local.seq, changed=false;
+  for(;;){
+    const r=await fetch(`${API_BASE}/api/user/${mobile}/changes?since=${seq}&limit=5000`);
+    if(!r.ok) return null;
+    const d=await r.json();
+    if(d.reset){byId.clear();changed=true;}
+    for(const it of d.items||[]){byId.set(it.id,it);changed=true;}
+    for(const id of d.deleted||[]) changed=byId.delete(id)||changed;
+    seq=d.seq;
+    if(!d.more) break;
+  }
+  if(!changed && seq===local.seq) return local.entries;
+  const entries=[...byId.values()].sort((a,b)=>a.date<b.date?1:a.date>b.date?-1:b.id-a.id);
+  db[mobile]={seq,entries};
+  saveDB(db);
+  return entries;
+}
 async function refreshEntriesForCurrentUser(currentUser,setEntries){
   if(!currentUser?.mobile) return;
-  const fresh=await apiListEntries(currentUser.mobile);
+  const fresh=(await apiSyncEntries(currentUser.mobile))??await apiListEntries(currentUser.mobile);
   setEntries(fresh);
 }
 
@@ -161,12 +272,13 @@ const LABELS = {
     EXPENSE_PAYABLE: "Expense (Payable)",
     DAY_WISE: "Day-wise totals:",
     INVENTORY_TITLE: "📦 Inventory — Month to date (SKU units):",
-    CREDITORS_TITLE: "📒 Creditors — Month to date",
+    CREDITORS_TITLE: "📒 Creditors — Outstanding",
     TOTAL_RECEIVABLES: "Total Receivables",
     CUSTOMER_WISE: "Customer-wise:",
-    PAYABLES_TITLE: "📚 Payables — Month to date",
+    PAYABLES_TITLE: "📚 Payables — Outstanding",
     TOTAL_PAYABLES: "Total Payables",
     VENDOR_WISE: "Vendor-wise:",
+    AGING: (a) => `0–7d ₹${a["0-7"]} • 8–30d ₹${a["8-30"]} • 30+d ₹${a["30+"]}`,
     LEDGER: 'Ledger',
     SUMMARY: 'Summary',
     CREDITORS: 'Creditors',
@@ -243,12 +355,13 @@ Type items now. When done, type 'done'. You can 'remove N', 'preview', or 'cance
     EXPENSE_PAYABLE: "देय खर्च",
     DAY_WISE: "दिनवार विवरण:",
     INVENTORY_TITLE: "📦 इन्वेंटरी — माह-से-तारीख (SKU यूनिट):",
-    CREDITORS_TITLE: "📒 देनदार — माह-से-तारीख",
+    CREDITORS_TITLE: "📒 देनदार — बकाया",
     TOTAL_RECEIVABLES: "कुल बकाया",
     CUSTOMER_WISE: "ग्राहकवार:",
-    PAYABLES_TITLE: "📚 लेनदार — माह-से-तारीख",
+    PAYABLES_TITLE: "📚 लेनदार — बकाया",
     TOTAL_PAYABLES: "कुल देय",
     VENDOR_WISE: "विक्रेतावार:",
+    AGING: (a) => `0–7 दिन ₹${a["0-7"]} • 8–30 दिन ₹${a["8-30"]} • 30+ दिन ₹${a["30+"]}`,
     LEDGER: 'बही-खाता',
     SUMMARY: 'हिसाब-किताब',
     CREDITORS: 'देनदार',
@@ -333,7 +446,7 @@ export default function App(){
   const [pendingSetting,setPendingSetting]=useState(null); // {key:'store_name', label:'Store Name', value:'...'} or null
 
   // Views & drilldowns
-  const [invView,setInvView]=useState({context:'none',from:null,to:null,page:1,pageSize:20,rows:[]});
+  const [invView,setInvView]=useState({context:'none',from:null,to:null,page:1,pageSize:20,pages:1});
   const [sumView,setSumView]=useState({context:'none',date:null,page:1,pageSize:20,rows:[]});
   const [creditorQuery,setCreditorQuery]=useState('');
   const [vendorQuery,setVendorQuery]=useState('');
@@ -382,29 +495,20 @@ export default function App(){
   /* =====================================================================================
      Builders: Credit & Payables
   ===================================================================================== */
-  function buildCreditorsMonthSummary(list){
-    const som=startOfMonth(new Date());
-    const rows=list.filter(e=>e.credit&&e.revenue>0&&new Date(e.date)>=som);
-    if(!rows.length) return 'No outstanding credits for this month.';
-    const byName=new Map();
-    rows.forEach(e=>{
-      const name=(e.creditor||'Unknown').trim();
-      const key=name.toLowerCase();
-      if(!byName.has(key)) byName.set(key,{name,total:0});
-      byName.get(key).total+=e.revenue;
-    });
-    const groups=Array.from(byName.values()).sort((a,b)=>a.name.localeCompare(b.name));
-    const monthTotal=rows.reduce((s,e)=>s+e.revenue,0);
-    let out = `${L.CREDITORS_TITLE}\n${L.TOTAL_RECEIVABLES}: ₹${monthTotal}\n\n${L.CUSTOMER_WISE}\n`;
-    groups.forEach(g=>{out+=`- ${g.name}: ₹${g.total}\n`;});
+  // Balances come from the server, already netted against repayments.
+  function buildCreditorsSummary(data){
+    const rows=data?.counterparties||[];
+    if(!rows.length) return 'No outstanding credits.';
+    let out = `${L.CREDITORS_TITLE}\n${L.TOTAL_RECEIVABLES}: ₹${data.totals.balance}\n${L.AGING(data.totals)}\n\n${L.CUSTOMER_WISE}\n`;
+    rows.forEach(g=>{out+=`- ${g.name}: ₹${g.balance} (${L.AGING(g.aging)})\n`;});
     out+=`\n(Type a customer name to view date-wise details, or 'ledger' to go back.)`;
     return out;
   }
   function buildCreditorDetails(list,nameQuery){
     const som=startOfMonth(new Date());
-    const q=nameQuery.trim().toLowerCase();
+    const q=foldName(nameQuery);
     const rows=list.filter(e=>
-      e.credit&&e.revenue>0&&new Date(e.date)>=som&&(e.creditor||'').trim().toLowerCase()===q
+      e.credit&&e.revenue>0&&new Date(e.date)>=som&&foldName(e.creditor)===q
     );
     if(!rows.length) return `No entries for "${nameQuery}" this month.`;
     rows.sort((a,b)=>new Date(a.date)-new Date(b.date));
@@ -417,29 +521,19 @@ export default function App(){
     return out;
   }
 
-  function buildPayablesMonthSummary(list){
-    const som=startOfMonth(new Date());
-    const rows=list.filter(e=>e.credit&&e.revenue<0&&new Date(e.date)>=som);
-    if(!rows.length) return 'No outstanding payables for this month.';
-    const byVendor=new Map();
-    rows.forEach(e=>{
-      const name=(e.creditor||'Unknown Vendor').trim();
-      const key=name.toLowerCase();
-      if(!byVendor.has(key)) byVendor.set(key,{name,total:0});
-      byVendor.get(key).total+=Math.abs(e.revenue);
-    });
-    const groups=Array.from(byVendor.values()).sort((a,b)=>a.name.localeCompare(b.name));
-    const monthTotal=rows.reduce((s,e)=>s+Math.abs(e.revenue),0);
-    let out = `${L.PAYABLES_TITLE}\n${L.TOTAL_PAYABLES}: ₹${monthTotal}\n\n${L.VENDOR_WISE}\n`;
-    groups.forEach(g=>{out+=`- ${g.name}: ₹${g.total}\n`;});
+  function buildPayablesSummary(data){
+    const rows=data?.counterparties||[];
+    if(!rows.length) return 'No outstanding payables.';
+    let out = `${L.PAYABLES_TITLE}\n${L.TOTAL_PAYABLES}: ₹${data.totals.balance}\n${L.AGING(data.totals)}\n\n${L.VENDOR_WISE}\n`;
+    rows.forEach(g=>{out+=`- ${g.name}: ₹${g.balance} (${L.AGING(g.aging)})\n`;});
     out+=`\n(Type a vendor name to view date-wise details, or 'ledger' to go back.)`;
     return out;
   }
   function buildPayableDetails(list,vendorName){
     const som=startOfMonth(new Date());
-    const q=vendorName.trim().toLowerCase();
+    const q=foldName(vendorName);
     const rows=list.filter(e=>
-      e.credit&&e.revenue<0&&new Date(e.date)>=som&&(e.creditor||'').trim().toLowerCase()===q
+      e.credit&&e.revenue<0&&new Date(e.date)>=som&&foldName(e.creditor)===q
     );
     if(!rows.length) return `No entries for "${vendorName}" this month.`;
     rows.sort((a,b)=>new Date(a.date)-new Date(b.date));
@@ -453,6 +547,16 @@ export default function App(){
     return out;
   }
 
+  // One server-side page of the inventory report (already sorted by units sold).
+  function buildInventoryPage(inv){
+    const {from,to,page,pages,page_size:pageSize,items}=inv;
+    let out=`📦 ${L.INVENTORY} — ${from}${from!==to?` to ${to}`:''} (Page ${page}/${pages}, ${pageSize}/page)\n`;
+    if(!items.length) out+='No sales in this period.';
+    items.forEach(r=>{out+=`${r.rank}) ${r.product}: ${r.units} units\n`;});
+    if(pages>1) out+=`Type: next / prev / page N`;
+    return out;
+  }
+
   // ===== Invoice Preview (only on explicit 'preview' command) =====
   function buildInvoicePreview(itemsParam = null, customerParam = null, settingsParam = null) {
     const items = itemsParam ?? invItems;
@@ -506,6 +610,14 @@ export default function App(){
       pushBot(`❌ Invoice parsing failed: ${data?.error||'Unknown error'}`);
       return;
     }
+    if(data.status==='processing'){
+      pushBot("⏳ Still reading this invoice. Upload it again in a minute to record it.");
+      return;
+    }
+    if(data.duplicate){
+      pushBot(`ℹ️ This invoice from **${data.vendor||'Vendor'}** (₹${data.total_amount||0}) was already recorded on ${ymd(data.recorded_at)}. Nothing added.`);
+      return;
+    }
     await refreshEntriesForCurrentUser(currentUser,setEntries);
     pushBot(`✅ Processed invoice from **${data.vendor||'Vendor'}**. Added ${data.inserted||0} payable item(s), total ₹${data.total_amount||0}. Type 'payables' to view, or 'ledger' to continue.`);
   }
@@ -673,7 +785,7 @@ export default function App(){
     // Global exit back to Ledger from any sub-mode
     if(subMode!=='ledger' && /^(ledger|बही[ -]?खाता)$/i.test(text)){
       setSubMode('ledger');
-      setInvView({context:'none',from:null,to:null,page:1,pageSize:20,rows:[]});
+      setInvView({context:'none',from:null,to:null,page:1,pageSize:20,pages:1});
       setSumView({context:'none',date:null,page:1,pageSize:20,rows:[]});
       setCreditorQuery(''); setVendorQuery('');
       setPendingSetting(null);
@@ -751,21 +863,14 @@ export default function App(){
     if(mode==='ledger' && subMode==='ledger'){
       // INVENTORY
       if(/^(inventory|इन्वेंटरी)$/i.test(text)){
-        await refreshEntriesForCurrentUser(currentUser,setEntries);
-        if(!entries.length) return pushBot('No entries yet.');
-        const som=startOfMonth(new Date());
-        const monthSales=entries.filter(e=>e.revenue>0&&new Date(e.date)>=som);
-        if(!monthSales.length) return pushBot('No sales recorded this month.');
-        const skuMap=new Map();
-        monthSales.forEach(e=>{
-          const key=(e.product||'Unknown').trim();
-          skuMap.set(key,(skuMap.get(key)||0)+(Number(e.units)||0));
-        });
-        const monthSkuRows=Array.from(skuMap.entries()).sort((a,b)=>a[0].localeCompare(b[0]));
+        const inv=await apiGetInventory(currentUser.mobile,{sort:'name',pageSize:500});
+        if(!inv) return pushBot('Could not load inventory.');
+        if(!inv.items.length) return pushBot('No sales recorded this month.');
         let out = `${L.INVENTORY_TITLE}\n`;
-        monthSkuRows.forEach(([prod,units])=>{out+=`- ${prod}: ${units} units\n`;});
+        inv.items.forEach(r=>{out+=`- ${r.product}: ${r.units} units\n`;});
+        if(inv.pages>1) out+=`… ${inv.totals.products-inv.items.length} more\n`;
         setSubMode('inventory');
-        setInvView({context:'inventory',from:null,to:null,page:1,pageSize:20,rows:[]});
+        setInvView({context:'inventory',from:null,to:null,page:1,pageSize:20,pages:1});
         out+='\n(Enter a date like `12/08` or `12/aug`, a range like `12/08..15/08`, or type `ledger` to go back.)';
         return pushBot(out);
       }
@@ -773,36 +878,16 @@ export default function App(){
       // SUMMARY
       if (/^(summary|हिसाब[ -]?किताब)$/i.test(text)) {
         try {
-          await refreshEntriesForCurrentUser(currentUser, setEntries);
-          if (!entries.length) return pushBot('No entries yet.');
-
           const now = new Date(), som = startOfMonth(now);
-          const monthEntries = entries.filter(e => new Date(e.date) >= som);
-
-          let cashIn = 0, creditIn = 0, outPaid = 0, outPayable = 0;
-          const byDay = new Map();
-
-          monthEntries.forEach(e => {
-            const isExpense = e.revenue < 0;
-            const hasPaid = (e.product || '').toLowerCase().includes('paid');
-            const paid = isExpense && (hasPaid || !e.credit);
-            const payable = isExpense && !hasPaid && !!e.credit;
-
-            const day = ymd(e.date);
-            if (!byDay.has(day)) byDay.set(day, { cash: 0, credit: 0, outPaid: 0, outPayable: 0, tx: 0 });
-            const b = byDay.get(day);
-            b.tx += 1;
-
-            if (paid) {
-              outPaid += Math.abs(e.revenue); b.outPaid += Math.abs(e.revenue);
-            } else if (payable) {
-              outPayable += Math.abs(e.revenue); b.outPayable += Math.abs(e.revenue);
-            } else if (e.revenue > 0 && e.credit) {
-              creditIn += e.revenue; b.credit += e.revenue;
-            } else if (e.revenue > 0) {
-              cashIn += e.revenue; b.cash += e.revenue;
-            }
-          });
+          const summary = await apiGetSummary(
+            currentUser.mobile,
+            `${som.getFullYear()}-${pad2(som.getMonth() + 1)}-01`,
+            now.toISOString().slice(0, 10)
+          );
+          if (!summary) return pushBot('Sorry, I hit an error while building the summary.');
+          if (!summary.days.length) return pushBot('No entries yet.');
+
+          const { cash: cashIn, credit: creditIn, paid: outPaid, payable: outPayable } = summary.totals;
 
           const totalIncome = cashIn + creditIn;
           const totalExpense = outPaid + outPayable;
@@ -820,10 +905,8 @@ export default function App(){
           msg += `\n— — — — — — — —\n${L.DAY_WISE}\n`;
 
           msg += '\n— — — — — — — —\nDay-wise totals:\n';
-          const days = Array.from(byDay.entries()).sort((a, b) => b[0].localeCompare(a[0]));
-          days.forEach(([day, v]) => {
-            const netDay = v.cash + v.credit - (v.outPaid + v.outPayable);
-            msg += `- ${day}: Tx ${v.tx} • Cash ₹${v.cash}, Credit ₹${v.credit}, Paid ₹${v.outPaid}, Payable ₹${v.outPayable}, Net ₹${netDay}\n`;
+          summary.days.forEach(v => {
+            msg += `- ${v.day}: Tx ${v.tx} • Cash ₹${v.cash}, Credit ₹${v.credit}, Paid ₹${v.paid}, Payable ₹${v.payable}, Net ₹${v.net}\n`;
           });
 
           setSubMode('summary');
@@ -839,22 +922,62 @@ export default function App(){
       // CREDITORS / PAYABLES
       if(/^(creditors?|देनदार)$/i.test(text)){
         await refreshEntriesForCurrentUser(currentUser,setEntries);
-        const out=buildCreditorsMonthSummary(entries);
+        const out=buildCreditorsSummary(await apiGetBalances(currentUser.mobile,'receivables'));
         setSubMode('creditors');
         setCreditorQuery('');
         return pushBot(out);
       }
       if(/^(payables?|लेनदार)$/i.test(text)){
         await refreshEntriesForCurrentUser(currentUser,setEntries);
-        const out=buildPayablesMonthSummary(entries);
+        const out=buildPayablesSummary(await apiGetBalances(currentUser.mobile,'payables'));
         setSubMode('payables');
         setVendorQuery('');
         return pushBot(out);
       }
 
+      // TRENDS: weekly revenue, moving averages, products rising/falling, top credit customers
+      if(/^(trends?|analytics|रुझान)$/i.test(text)){
+        const a=await apiGetAnalytics(currentUser.mobile);
+        if(!a) return pushBot('Sorry, I could not load trends.');
+        if(!a.totals.revenue) return pushBot('No sales in the last year yet.');
+        const pct=c=>c===null?'':` (${c>=0?'+':''}${c}%)`;
+        const today=a.days[a.days.length-1];
+        let out=`📈 Trends to ${a.to}\n`;
+        out+=`Avg per day: ₹${Math.round(today.ma7)} (7 days), ₹${Math.round(today.ma30)} (30 days)\n`;
+        out+='\nLast 4 weeks:\n';
+        a.weeks.slice(-4).forEach(w=>{out+=`- ${w.start} → ${w.end}: ₹${w.revenue}${pct(w.change_pct)}\n`;});
+        if(a.top_products.length){
+          out+='\nTop sellers (4 weeks):\n';
+          a.top_products.slice(0,5).forEach(p=>{out+=`- ${p.product}: ₹${p.revenue}, ${p.units} units${pct(p.trend_pct)}\n`;});
+        }
+        if(a.declining.length){
+          out+='\nFalling fastest (₹/week):\n';
+          a.declining.slice(0,5).forEach(p=>{out+=`- ${p.product}: ₹${p.trend}/wk, ₹${p.revenue} vs ₹${p.previous_revenue} before\n`;});
+        }
+        if(a.top_customers.length){
+          out+='\nMost owed by:\n';
+          a.top_customers.slice(0,5).forEach(c=>{out+=`- ${c.name}: ₹${c.balance}\n`;});
+        }
+        return pushBot(out);
+      }
+
+      // SEARCH: "search surf excel suresh" / "खोज surf"
+      const searchM=text.match(/^(?:search|find|खोज)\s+(.+)$/i);
+      if(searchM){
+        const res=await apiSearchEntries(currentUser.mobile,searchM[1]);
+        if(!res) return pushBot('Sorry, search failed. Try again.');
+        if(!res.items.length) return pushBot(`No entries match "${searchM[1]}".`);
+        let out=`🔎 "${res.q}" (${res.sort==='rank'?'best matches':'newest first'})\n`;
+        res.items.forEach(e=>{
+          out+=`${ymd(e.date)}, ${e.product||'—'}${e.creditor?` · ${e.creditor}`:''}, ₹${e.revenue}${e.credit?' (credit)':''}\n`;
+        });
+        if(res.more) out+=`(Showing the first ${res.items.length}; add more words to narrow it down.)`;
+        return pushBot(out);
+      }
+
       // Add new entry via LLM
       
-      const parsed = await apiParseLLM(text);
+      const parsed = await apiParseLLM(text,currentUser.mobile);
       if (!parsed) {
         return pushBot("Couldn't parse that entry. Try: '2 colgate 100 ml 104 rs', '1 surf excel 1 kg 210 rs credit to Ramesh', '- 250 electricity paid', '-1200 rent payable to Landlord'.");
       }
@@ -879,12 +1002,13 @@ export default function App(){
         }
 
         // Pure money entry (cash/expense/credit only → no units)
+        // Keep the name even without credit: repayments carry it and the server nets them.
         return {
           product: it.product ?? null,  // ✅ keep null if backend says so
           units: null,
           revenue: Number(it.revenue || 0),
           credit: !!it.credit,
-          creditor: it.credit ? String(it.creditor || "") : "",
+          creditor: String(it.creditor || ""),
           date: new Date().toISOString(),
         };
       }).filter(it => it.revenue !== 0);
@@ -949,7 +1073,7 @@ export default function App(){
 
             pushBot(L.GENERATING);
 
-            const res=await apiCreateInvoice({
+            const {ok,data}=await apiCreateInvoice({
               customer:{name:invCustomer},
               items:invItems,
               paymentTerms:invoiceConfirm.value,
@@ -960,16 +1084,16 @@ export default function App(){
                 store_contact:biz?.store_contact||'',
               }
             });
+            const job=ok && data?.id ? await apiWaitInvoice(data.id) : null;
 
-            if(!res.ok){
+            if(!job || job.status!=='done'){
               setSubMode('ledger'); setInvoiceStep(0);
               return pushBot(L.INVOICE_FAIL);
             }
 
-            const blob=await res.blob();
-            const url=window.URL.createObjectURL(blob);
-            const ts=new Date().toISOString().slice(0,10);
-            const fileName=`invoice_${ts}.pdf`;
+            // stored server-side, so the link keeps working after this session
+            const url=`${API_BASE}/api/invoices/${job.id}`;
+            const fileName=`invoice_${job.invoice_no}.pdf`;
 
             // auto-download
             const a=document.createElement('a');
@@ -1045,55 +1169,29 @@ export default function App(){
     if(subMode==='inventory'){
       const range=parseLooseDateOrRange(text);
       if(range && invView.context==='inventory'){
-        if(!entries.length) return pushBot('No entries yet.');
-        const fromD=new Date(range.from+'T00:00:00Z');
-        const toD=new Date(range.to+'T23:59:59Z');
-        const periodSales=entries.filter(e=>e.revenue>0&&new Date(e.date)>=fromD&&new Date(e.date)<=toD);
-        const skuMap=new Map();
-        periodSales.forEach(e=>{
-          const key=(e.product||'Unknown').trim();
-          skuMap.set(key,(skuMap.get(key)||0)+(Number(e.units)||0));
-        });
-        const rows=Array.from(skuMap.entries())
-          .map(([prod,units])=>({prod,units}))
-          .sort((a,b)=>b.units-a.units||a.prod.localeCompare(b.prod));
-
         const pageSize=invView.pageSize||20;
-        setInvView({context:'inventory_detail',from:range.from,to:range.to,page:1,pageSize,rows});
-
-        const total=rows.length;
-        const totalPages=Math.max(1,Math.ceil(total/pageSize));
-        const slice=rows.slice(0,pageSize);
-        let out=`📦 ${L.INVENTORY} — ${range.from}${range.from!==range.to?` to ${range.to}`:''} (Page 1/${totalPages}, ${pageSize}/page)\n`;
-        if(!slice.length) out+='No sales in this period.';
-        slice.forEach((r,idx)=>{out+=`${idx+1}) ${r.prod}: ${r.units} units\n`;});
-        if(totalPages>1) out+=`Type: next / prev / page N`;
-        return pushBot(out);
+        const inv=await apiGetInventory(currentUser.mobile,{from:range.from,to:range.to,page:1,pageSize});
+        if(!inv) return pushBot('Could not load inventory.');
+        setInvView({context:'inventory_detail',from:range.from,to:range.to,page:1,pageSize,pages:inv.pages});
+        return pushBot(buildInventoryPage(inv));
       }
       if((/^next$/i.test(text)||/^prev$/i.test(text)||/^page\s+\d+$/i.test(text)) && invView.context==='inventory_detail'){
-        let {page,pageSize,rows,from,to}=invView;
-        const total=rows.length,totalPages=Math.max(1,Math.ceil(total/pageSize));
-        if(/^next$/i.test(text)) page=Math.min(totalPages,page+1);
+        let {page,pageSize,pages,from,to}=invView;
+        if(/^next$/i.test(text)) page=Math.min(pages,page+1);
         if(/^prev$/i.test(text)) page=Math.max(1,page-1);
-        const pm=text.match(/^page\s+(\d+)$/i); if(pm) page=Math.min(totalPages,Math.max(1,parseInt(pm[1],10)));
-        setInvView({...invView,page});
-        const start=(page-1)*pageSize;
-        const slice=rows.slice(start,start+pageSize);
-        let out=`📦 ${L.INVENTORY} — ${from}${from!==to?` to ${to}`:''} (Page ${page}/${totalPages}, ${pageSize}/page)\n`;
-        slice.forEach((r,idx)=>{out+=`${start+idx+1}) ${r.prod}: ${r.units} units\n`;});
-        if(totalPages>1) out+=`Type: next / prev / page N`;
-        return pushBot(out);
+        const pm=text.match(/^page\s+(\d+)$/i); if(pm) page=Math.min(pages,Math.max(1,parseInt(pm[1],10)));
+        const inv=await apiGetInventory(currentUser.mobile,{from,to,page,pageSize});
+        if(!inv) return pushBot('Could not load inventory.');
+        setInvView({...invView,page,pages:inv.pages});
+        return pushBot(buildInventoryPage(inv));
       }
     }
 
     if(subMode==='summary'){
       const range=parseLooseDateOrRange(text);
       if(range && range.from===range.to && sumView.context==='summary'){
-        if(!entries.length) return pushBot('No entries yet.');
         const day=range.from;
-        const dayEntries=entries
-          .filter(e=>ymd(e.date)===day)
-          .sort((a,b)=>new Date(a.date)-new Date(b.date));
+        const dayEntries=(await apiListEntries(currentUser.mobile,{from:day,to:day})).reverse();
 
         const rows = dayEntries.map(e => {
           const isExpense = e.revenue < 0;
@@ -1148,12 +1246,14 @@ export default function App(){
     }
 
     if(subMode==='creditors'){
-      setCreditorQuery(text);
-      return pushBot(buildCreditorDetails(entries,text));
+      const name=await apiMatchCounterparty(currentUser.mobile,text);
+      setCreditorQuery(name);
+      return pushBot(buildCreditorDetails(entries,name));
     }
     if(subMode==='payables'){
-      setVendorQuery(text);
-      return pushBot(buildPayableDetails(entries,text));
+      const name=await apiMatchCounterparty(currentUser.mobile,text);
+      setVendorQuery(name);
+      return pushBot(buildPayableDetails(entries,name));
     }
   }
 
@@ -8,5 +8,13 @@ export function loadDB() {
 }
 
 export function saveDB(db) {
-  localStorage.setItem('ledgerDB_v3', JSON.stringify(db));
-}
\ No newline at end of file
+  // Over the quota (a very large ledger) the copy just isn't kept; the next
+  // sync starts from scratch.
+  try {
+    localStorage.setItem('ledgerDB_v3', JSON.stringify(db));
+    return true;
+  } catch {
+    localStorage.removeItem('ledgerDB_v3');
+    return false;
+  }
+}
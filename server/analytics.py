@@ -0,0 +1,125 @@
+"""
+Sales trends for one shop, computed over NumPy arrays.
+
+Input is rows of the rollup tables (daily_rollups, product_sales) with each
+day already turned into an offset from the first day of the window, so
+every metric is a few whole-array operations rather than a loop over days:
+
+  daily totals     rollup rows scattered into one slot per day (days with
+                   no sales stay 0)
+  moving averages  a difference of cumulative sums
+  week over week   the daily totals reshaped to (weeks, 7) and summed
+                   along each row; weeks end on the as-of day
+  product trends   product_sales summed into a (product, week) matrix;
+                   each row's least-squares slope is one matrix-vector
+                   product
+
+Only the few rows that are returned are touched from Python.
+"""
+import numpy as np
+
+MA_WINDOWS = (7, 30)
+WARMUP = max(MA_WINDOWS) - 1  # days loaded before the window so its first averages are full
+TREND_WEEKS = 8               # product trends are fitted over the last 8 weeks
+TOP_WEEKS = 4                 # top sellers: revenue over the last 4 weeks
+
+
+def scatter(offsets, values, lo, hi):
+    """Totals per day for offsets lo..hi-1 (a dense int64 array of hi - lo)."""
+    out = np.zeros(hi - lo, dtype=np.int64)
+    keep = (offsets >= lo) & (offsets < hi)
+    np.add.at(out, offsets[keep] - lo, values[keep])
+    return out
+
+
+def moving_average(x, k):
+    """Trailing k-day mean of x at x[k-1:]."""
+    c = np.concatenate(([0], np.cumsum(x)))
+    return (c[k:] - c[:-k]) / k
+
+
+def change_pct(current, previous):
+    """Percent change, element-wise; None where previous is 0."""
+    current = np.asarray(current, dtype=np.float64)
+    previous = np.asarray(previous, dtype=np.float64)
+    pct = np.divide(current - previous, previous, out=np.full(current.shape, np.nan), where=previous != 0)
+    return [None if np.isnan(p) else round(float(p) * 100, 1) for p in pct]
+
+
+def product_weeks(sale_rows, days, weeks=TREND_WEEKS):
+    """
+    (ids, revenue, units) for sale_rows (offset, product_id, units, revenue):
+    revenue and units are (len(ids), weeks) matrices, the last column the
+    week ending on day days - 1.
+    """
+    first = days - weeks * 7
+    rows = sale_rows[(sale_rows[:, 0] >= first) & (sale_rows[:, 0] < days)]
+    ids, slot = np.unique(rows[:, 1], return_inverse=True)
+    week = (rows[:, 0] - first) // 7
+    revenue = np.zeros((len(ids), weeks), dtype=np.int64)
+    units = np.zeros((len(ids), weeks), dtype=np.int64)
+    np.add.at(revenue, (slot, week), rows[:, 3])
+    np.add.at(units, (slot, week), rows[:, 2])
+    return ids, revenue, units
+
+
+def trend(matrix):
+    """Least-squares slope of each row against its column number (per week), and the row means."""
+    t = np.arange(matrix.shape[1], dtype=np.float64)
+    t -= t.mean()
+    return matrix @ t / (t @ t), matrix.mean(axis=1)
+
+
+def dashboard(days, day_rows, sale_rows, top=10):
+    """
+    Metrics for a days-long window; offset days - 1 is the as-of day.
+
+      day_rows   int64 (n, 3): offset, revenue, expense per day, for
+                 offsets -WARMUP..days-1
+      sale_rows  int64 (m, 4): offset, product_id, units, revenue per
+                 product-day, for at least the last TREND_WEEKS weeks
+
+    Returns plain Python values; products are ids.
+    """
+    revenue = scatter(day_rows[:, 0], day_rows[:, 1], -WARMUP, days)
+    expense = scatter(day_rows[:, 0], day_rows[:, 2], -WARMUP, days)
+    out = {
+        "totals": {
+            "revenue": int(revenue[WARMUP:].sum()),
+            "expense": int(expense[WARMUP:].sum()),
+            "net": int(revenue[WARMUP:].sum() - expense[WARMUP:].sum()),
+        },
+        "revenue": revenue[WARMUP:].tolist(),
+        "expense": expense[WARMUP:].tolist(),
+    }
+    for k in MA_WINDOWS:
+        out[f"ma{k}"] = np.round(moving_average(revenue, k)[WARMUP - k + 1:], 2).tolist()
+
+    # whole weeks ending on the as-of day, plus the one before the first for its change
+    n = min(days // 7 + 1, len(revenue) // 7)
+    week = revenue[len(revenue) - n * 7:].reshape(n, 7).sum(axis=1)
+    out["weeks"] = [{"end": days - 1 - 7 * (n - 2 - i), "revenue": int(r), "change_pct": c}
+                    for i, (r, c) in enumerate(zip(week[1:].tolist(), change_pct(week[1:], week[:-1])))]
+
+    ids, rev, units = product_weeks(sale_rows, days)
+    slope, mean = trend(rev)
+    recent = rev[:, -TOP_WEEKS:].sum(axis=1)
+    recent_units = units[:, -TOP_WEEKS:].sum(axis=1)
+    before = rev[:, -2 * TOP_WEEKS:-TOP_WEEKS].sum(axis=1)
+
+    def item(i):
+        return {
+            "product_id": int(ids[i]),
+            "units": int(recent_units[i]),
+            "revenue": int(recent[i]),
+            "previous_revenue": int(before[i]),
+            "trend": round(float(slope[i]), 2),
+            "trend_pct": round(float(slope[i] / mean[i]) * 100, 1) if mean[i] else None,
+        }
+
+    # np.lexsort sorts by its last key first
+    best = np.lexsort((ids, -recent_units, -recent))
+    out["top_products"] = [item(i) for i in best[:top] if recent[i] > 0]
+    falling = np.flatnonzero(slope < 0)
+    out["declining"] = [item(i) for i in falling[np.lexsort((ids[falling], slope[falling]))][:top]]
+    return out
@@ -0,0 +1,79 @@
+"""
+Latency of /api/user/<mobile>/analytics over a year of one shop's sales.
+
+    python bench/analytics.py [--years 1] [--neighbours 20] [--runs 50]
+
+Loads one shop with --years of seedgen entries (about 30k a year) plus
+--neighbours one-year shops on the same database file, through seed_shops
+into a throwaway database, then times the dashboard through the Flask test
+client: cold (memo cleared before every call, so the rollup reads and the
+NumPy work are in it) and warm (served from the memo after the
+ledger_version check). "cold, 730 days" is the longest window allowed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MOBILE = "7100000000"
+
+
+def pct(sorted_vals, p):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--years", type=int, default=1)
+    ap.add_argument("--neighbours", type=int, default=20)
+    ap.add_argument("--runs", type=int, default=50)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ledger-analytics-")
+    os.environ["LEDGER_DB_PATH"] = os.path.join(tmp, "ledger.db")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    import app  # noqa: E402  (reads LEDGER_DB_PATH at import)
+
+    first = date(date.today().year - args.years, date.today().month, 1)
+    t0 = time.perf_counter()
+    with app.app.app_context():
+        _, big = app.seed_shops([MOBILE], first, args.years * 12)
+        _, small = app.seed_shops([f"72{i:08d}" for i in range(args.neighbours)], first, 12, seed=1)
+        as_of = app.get_db(MOBILE).execute(
+            "SELECT MAX(day) FROM daily_rollups WHERE mobile = ?", (MOBILE,)).fetchone()[0]
+    print(f"{big} rows in the shop, {small} in {args.neighbours} neighbours, loaded in "
+          f"{time.perf_counter() - t0:.1f}s")
+
+    client = app.app.test_client()
+    cases = [
+        ("cold, 365 days", f"as_of={as_of}", True),
+        ("cold, 730 days", f"as_of={as_of}&days=730", True),
+        ("cold, 30 days", f"as_of={as_of}&days=30", True),
+        ("warm, 365 days", f"as_of={as_of}", False),
+    ]
+    print(f"{'case':<18}{'p50 ms':>9}{'p99 ms':>9}{'KB':>7}  top product, declining")
+    for label, qs, cold in cases:
+        url = f"/api/user/{MOBILE}/analytics?{qs}"
+        r = client.get(url)
+        assert r.status_code == 200, r.data
+        body = r.get_json()
+        times = []
+        for _ in range(args.runs):
+            if cold:
+                app._analytics_cache.clear()
+            t0 = time.perf_counter()
+            r = client.get(url)
+            times.append(time.perf_counter() - t0)
+            assert r.headers["X-Cache"] == ("miss" if cold else "hit")
+        times.sort()
+        top = body["top_products"][0]["product"] if body["top_products"] else "-"
+        print(f"{label:<18}{pct(times, 0.5) * 1000:>9.2f}{pct(times, 0.99) * 1000:>9.2f}"
+              f"{len(r.data) / 1024:>7.0f}  {top}, {len(body['declining'])}")
+
+
+if __name__ == "__main__":
+    main()
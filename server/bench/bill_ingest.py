@@ -0,0 +1,151 @@
+"""
+Vendor bills/minute through /api/ingestInvoice: new bills, then re-uploads.
+
+    python bench/bill_ingest.py [--bills 60] [--threads 1,4] [--model-share 0.2] [--latency-ms 800]
+
+Each thread count runs in its own process against a throwaway database and
+bill store. The bills are rendered up front with invoice_render (5-40 lines
+each, a dozen vendors); --model-share of them are plain-text layouts with
+no numbered rows, which the patterns can't itemize, so they go through the
+model step -- answered by bench/llm_stub.py after --latency-ms. Every bill
+is then uploaded a second time: those should be hash hits, answered
+without extraction or inserts.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VENDORS = ["HUL Distributor", "Metro Cash&Carry", "ITC Distributor", "Nestle Distributor", "Star Wholesale",
+           "PepsiCo Distributor", "Tata Consumer Distributor", "Adani Wilmar Distributor", "Bisleri Distributor",
+           "VR Super Distributors", "Coca-Cola Distributor", "Packaging Vendor"]
+
+
+def pct(sorted_vals, p):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p))]
+
+
+def make_bills(n, model_share, seed=0):
+    """[(pdf bytes, needs the model)], distinct files."""
+    from reportlab.pdfgen import canvas
+    from invoice_render import render_invoice
+    from seedgen import catalog
+
+    rnd = random.Random(seed)
+    cat = catalog()
+    bills = []
+    for i in range(n):
+        vendor = VENDORS[i % len(VENDORS)]
+        lines = rnd.sample(cat, rnd.randint(5, 40))
+        if rnd.random() < model_share:
+            buf = io.BytesIO()
+            cv = canvas.Canvas(buf)
+            rows = [vendor, f"Bill No: FB-{i:05d}  Date: 2026-10-01"]
+            rows += [f"{sku} .... {price * 10:.2f}" for sku, price in lines]
+            rows.append(f"Total Rs. {sum(p * 10 for _, p in lines):.2f}")
+            y = 800
+            for row in rows:
+                if y < 40:
+                    cv.showPage()
+                    y = 800
+                cv.drawString(40, y, row)
+                y -= 16
+            cv.save()
+            bills.append((buf.getvalue(), True))
+        else:
+            pdf, _ = render_invoice({
+                "customer": {"name": "Sharma General Store"},
+                "business": {"store_name": vendor, "store_gst": "27ABCDE1234F1Z5"},
+                "items": [{"description": sku, "price": price * 10, "gstPercent": (0, 5, 12, 18)[k % 4]}
+                          for k, (sku, price) in enumerate(lines)],
+            }, invoice_no=f"INV-{i:05d}")
+            bills.append((pdf, False))
+    return bills
+
+
+def child(n_bills, threads, model_share, latency_ms):
+    """Runs in the per-config process; prints results as JSON."""
+    import llm_stub
+    _server, url = llm_stub.serve(0, latency_ms=latency_ms, jitter_ms=latency_ms / 4)
+    os.environ["OPENAI_BASE_URL"] = url
+    import app  # noqa: E402  (reads LEDGER_* and OPENAI_BASE_URL at import)
+
+    bills = make_bills(n_bills, model_share)
+    mobiles = [f"96{i:08d}" for i in range(8)]
+    out = {}
+    for phase in ("new", "repeat"):
+        todo = list(enumerate(bills))
+        latencies, errors, sources = [], [0], {}
+        lock = threading.Lock()
+
+        def work():
+            client = app.app.test_client()
+            while True:
+                with lock:
+                    if not todo:
+                        return
+                    i, (pdf, _needs_model) = todo.pop()
+                t0 = time.perf_counter()
+                r = client.post("/api/ingestInvoice", content_type="multipart/form-data",
+                                data={"mobile": mobiles[i % len(mobiles)], "file": (io.BytesIO(pdf), f"{i}.pdf")})
+                dt = time.perf_counter() - t0
+                body = r.get_json() or {}
+                with lock:
+                    if r.status_code == 200:
+                        latencies.append(dt)
+                        key = "duplicate" if body.get("duplicate") else body.get("source")
+                        sources[key] = sources.get(key, 0) + 1
+                    else:
+                        errors[0] += 1
+
+        t0 = time.perf_counter()
+        pool = [threading.Thread(target=work) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        lat = sorted(latencies) or [0.0]
+        out[phase] = {"per_min": len(latencies) / elapsed * 60, "p50": pct(lat, 0.50) * 1000,
+                      "p99": pct(lat, 0.99) * 1000, "errors": errors[0], "sources": sources}
+    print(json.dumps(out))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--bills", type=int, default=60)
+    ap.add_argument("--threads", default="1,4")
+    ap.add_argument("--model-share", type=float, default=0.2)
+    ap.add_argument("--latency-ms", type=float, default=800.0)
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        return child(args.bills, int(args.threads), args.model_share, args.latency_ms)
+
+    print(f"{args.bills} bills, {args.model_share:.0%} via the model step (stub, {args.latency_ms:.0f} ms)")
+    print(f"{'threads':>7} {'phase':<7}{'bills/min':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}  sources")
+    for n in [int(x) for x in args.threads.split(",") if x]:
+        tmp = tempfile.mkdtemp(prefix="ledger-bills-")
+        env = dict(os.environ, LEDGER_DB_PATH=os.path.join(tmp, "ledger.db"), OPENAI_API_KEY="bench",
+                   LEDGER_BILL_DIR=os.path.join(tmp, "bills"))
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--bills", str(args.bills),
+                              "--threads", str(n), "--model-share", str(args.model_share),
+                              "--latency-ms", str(args.latency_ms)],
+                             env=env, capture_output=True, text=True, check=True).stdout
+        res = json.loads(out.strip().splitlines()[-1])
+        for phase, r in res.items():
+            print(f"{n:>7} {phase:<7}{r['per_min']:>10.0f}{r['p50']:>9.1f}{r['p99']:>9.1f}{r['errors']:>8}  "
+                  f"{r['sources']}")
+
+
+if __name__ == "__main__":
+    main()
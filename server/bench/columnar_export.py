@@ -0,0 +1,122 @@
+"""
+Columnar export vs the JSON paths: rows/s, bytes and memory.
+
+    python bench/columnar_export.py [--shops 34] [--months 12] [--skip-json]
+
+Loads --shops synthetic shops (seed_shops, about 2,450 entries per
+shop-month; 34 x 12 is about 1M rows, 340 x 12 about 10M) into a throwaway
+database, then:
+
+  one shop   the busiest shop through /entries pages (what the finance
+             scripts scrape today), /export?format=ndjson, and
+             /export?format=arrow|parquet
+  all shops  every shop's /export?format=ndjson in turn, against
+             `flask export-columnar` writing the mobile=/month= dataset as
+             Arrow and as Parquet, read back with pyarrow.dataset to check
+             the row count
+
+Peak anonymous RSS is sampled through each phase (bench/import_export.py's
+MemoryWatch); it should stay flat as --shops grows. --skip-json leaves out
+the all-shops NDJSON pass, which dominates the run at 10M rows.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from import_export import MemoryWatch  # noqa: E402
+
+
+def drain(resp):
+    n = 0
+    for piece in resp.response:
+        n += len(piece)
+    resp.close()
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--shops", type=int, default=34)
+    ap.add_argument("--months", type=int, default=12)
+    ap.add_argument("--skip-json", action="store_true")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ledger-columnar-")
+    os.environ["LEDGER_DB_PATH"] = os.path.join(tmp, "ledger.db")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    import app  # noqa: E402  (reads LEDGER_DB_PATH at import)
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    mobiles = [f"95{i:08d}" for i in range(args.shops)]
+    t0 = time.perf_counter()
+    with app.app.app_context():
+        _, total = app.seed_shops(mobiles, date(2025, 1, 1), args.months)
+        counts = {m: app.get_db(m).execute("SELECT COUNT(*) FROM entries WHERE mobile = ?", (m,)).fetchone()[0]
+                  for m in mobiles}
+    print(f"{total} rows in {args.shops} shops, loaded in {time.perf_counter() - t0:.0f}s")
+    busiest = max(counts, key=counts.get)
+
+    client = app.app.test_client()
+    mem = MemoryWatch()
+    print(f"{'phase':<34}{'rows':>10}{'seconds':>9}{'rows/s':>10}{'MB out':>8}{'peak MB':>9}")
+
+    def report(label, rows, seconds, nbytes, base):
+        print(f"{label:<34}{rows:>10}{seconds:>9.2f}{rows / seconds:>10.0f}{nbytes / 2**20:>8.1f}"
+              f"{mem.peak - base:>9.1f}")
+
+    # one shop
+    n = counts[busiest]
+    base = mem.reset()
+    t0 = time.perf_counter()
+    rows, nbytes, cursor = 0, 0, None
+    while True:
+        r = client.get(f"/api/user/{busiest}/entries?limit=1000" + (f"&cursor={cursor}" if cursor else ""))
+        body = r.get_json()
+        rows += len(body["items"])
+        nbytes += len(r.data)
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    report("1 shop  /entries pages (JSON)", rows, time.perf_counter() - t0, nbytes, base)
+    for fmt in ("ndjson", "arrow", "parquet"):
+        base = mem.reset()
+        t0 = time.perf_counter()
+        if fmt == "arrow":
+            raw = client.get(f"/api/user/{busiest}/export?format=arrow").data
+            got = pa.ipc.open_stream(raw).read_all().num_rows
+            nbytes = len(raw)
+            assert got == n, (got, n)
+        else:
+            nbytes = drain(client.get(f"/api/user/{busiest}/export?format={fmt}", buffered=False))
+        report(f"1 shop  /export?format={fmt}", n, time.perf_counter() - t0, nbytes, base)
+
+    # every shop
+    if not args.skip_json:
+        base = mem.reset()
+        t0 = time.perf_counter()
+        nbytes = sum(drain(client.get(f"/api/user/{m}/export?format=ndjson", buffered=False)) for m in mobiles)
+        report("all     /export ndjson, per shop", total, time.perf_counter() - t0, nbytes, base)
+    runner = app.app.test_cli_runner()
+    for fmt in ("arrow", "parquet"):
+        out = os.path.join(tmp, f"dataset-{fmt}")
+        base = mem.reset()
+        t0 = time.perf_counter()
+        res = runner.invoke(args=["export-columnar", out, "--format", fmt])
+        seconds = time.perf_counter() - t0
+        assert res.exit_code == 0, res.output
+        nbytes = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(out) for f in fs)
+        got = ds.dataset(out, format="ipc" if fmt == "arrow" else "parquet", partitioning="hive").count_rows()
+        assert got == total, (got, total)
+        report(f"all     export-columnar {fmt}", total, seconds, nbytes, base)
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Mixed read/write load against the entries table: per-request connections in
+rollback-journal mode (the old get_db) vs. the pooled WAL configuration.
+
+    python bench/db_load.py [--rows 50000] [--readers 8] [--writers 2] [--seconds 5]
+
+Runs offline against temporary database files; doesn't import the Flask app.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlite_pool import ConnectionPool  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE entries (
+  id       INTEGER PRIMARY KEY AUTOINCREMENT,
+  mobile   TEXT NOT NULL,
+  product  TEXT,
+  units    INTEGER NOT NULL,
+  revenue  INTEGER NOT NULL,
+  credit   INTEGER NOT NULL,
+  creditor TEXT,
+  date     TEXT NOT NULL
+);
+CREATE INDEX idx_entries_mobile_date ON entries (mobile, date);
+"""
+INSERT = "INSERT INTO entries (mobile, product, units, revenue, credit, creditor, date) VALUES (?, ?, ?, ?, ?, ?, ?)"
+READ = ("SELECT id, product, units, revenue, credit, creditor, date FROM entries "
+        "WHERE mobile = ? ORDER BY date DESC, id DESC LIMIT 200")
+MOBILES = [f"90000{i:05d}" for i in range(50)]
+
+
+def make_row(rng):
+    day = rng.randint(1, 28)
+    return (rng.choice(MOBILES), f"SKU {rng.randint(1, 500)}", rng.randint(1, 3),
+            rng.randint(10, 900), 0, None, f"2025-08-{day:02d}T{rng.randint(0, 23):02d}:00:00Z")
+
+
+def build_db(path, rows):
+    rng = random.Random(7)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(INSERT, (make_row(rng) for _ in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def run(get_conn, put_conn, readers, writers, seconds):
+    stop = time.perf_counter() + seconds
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        n = err = 0
+        while time.perf_counter() < stop:
+            conn = get_conn()
+            try:
+                conn.execute(READ, (rng.choice(MOBILES),)).fetchall()
+                n += 1
+            except sqlite3.OperationalError:
+                err += 1
+            finally:
+                put_conn(conn)
+        with lock:
+            counts["reads"] += n
+            counts["errors"] += err
+
+    def writer(seed):
+        rng = random.Random(seed)
+        n = err = 0
+        while time.perf_counter() < stop:
+            conn = get_conn()
+            try:
+                conn.executemany(INSERT, [make_row(rng) for _ in range(3)])
+                conn.commit()
+                n += 1
+            except sqlite3.OperationalError:
+                conn.rollback()
+                err += 1
+            finally:
+                put_conn(conn)
+        with lock:
+            counts["writes"] += n
+            counts["errors"] += err
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(1000 + i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    counts["reads"] /= seconds
+    counts["writes"] /= seconds
+    return counts
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=50000)
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=2)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, "before.db")
+        after_path = os.path.join(tmp, "after.db")
+        build_db(before_path, args.rows)
+        build_db(after_path, args.rows)
+
+        def fresh_conn():
+            conn = sqlite3.connect(before_path)
+            conn.row_factory = sqlite3.Row
+            return conn
+
+        before = run(fresh_conn, lambda c: c.close(), args.readers, args.writers, args.seconds)
+
+        pool = ConnectionPool(after_path)
+        after = run(pool.connection, pool.release, args.readers, args.writers, args.seconds)
+        pool.close_all()
+
+    print(f"{'mode':<32}{'reads/s':>10}{'writes/s':>10}{'errors':>8}")
+    for label, r in (("per-request, rollback journal", before), ("pooled, WAL", after)):
+        print(f"{label:<32}{r['reads']:>10.0f}{r['writes']:>10.0f}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Entry posts with and without group commit, from concurrent request threads.
+
+    python bench/group_commit.py [--threads 16] [--seconds 5] [--window-ms 5] [--shops 32]
+
+Each mode runs in its own process against a throwaway database: --threads
+threads (a gunicorn gthread worker's request threads) POST one-item
+add_entries requests through the test client as fast as they're answered.
+Without group commit every request is a transaction and the threads queue
+on SQLite's write lock; with it, one flusher thread commits whatever
+arrived in the last --window-ms. "sync" modes fsync every commit
+(synchronous=FULL); "queued" answers before the write.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = [
+    # (label, group commit window ms, ack)
+    ("per-request commit", 0, "commit"),
+    ("per-request sync", 0, "sync"),
+    ("group commit", None, "commit"),
+    ("group sync", None, "sync"),
+    ("group queued", None, "queued"),
+]
+
+
+def pct(sorted_vals, p):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p))]
+
+
+def child(threads, seconds, shops):
+    """Runs in the per-mode process; prints results as JSON."""
+    import app  # noqa: E402  (reads LEDGER_* at import)
+
+    mobiles = [f"94{i:08d}" for i in range(shops)]
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def work(seed):
+        client, rnd = app.app.test_client(), random.Random(seed)
+        mine, failed = [], 0
+        while time.perf_counter() < stop_at:
+            item = {"product": f"Item {rnd.randrange(100)}", "units": 1, "revenue": rnd.randint(10, 500),
+                    "credit": False}
+            t0 = time.perf_counter()
+            r = client.post(f"/api/user/{rnd.choice(mobiles)}/entries", json={"items": [item]})
+            if r.status_code in (200, 202):
+                mine.append(time.perf_counter() - t0)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    t0 = time.perf_counter()
+    pool = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    if app.ingest is not None:
+        app.ingest.drain()
+        commits = app.ingest.snapshot()["commits"]
+    else:
+        commits = len(latencies)
+    with app.app.app_context():
+        saved = app.get_db().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    lat = sorted(latencies) or [0.0]
+    print(json.dumps({"requests_s": len(latencies) / elapsed, "commits_s": commits / elapsed, "saved": saved,
+                      "requests": len(latencies), "p50": pct(lat, 0.50) * 1000, "p99": pct(lat, 0.99) * 1000,
+                      "errors": errors[0]}))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--window-ms", type=float, default=5.0)
+    ap.add_argument("--shops", type=int, default=32)
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        return child(args.threads, args.seconds, args.shops)
+
+    print(f"{args.threads} request threads, {args.shops} shops, one item per post, {args.seconds:.0f}s per mode")
+    print(f"{'mode':<20}{'req/s':>8}{'commits/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for label, window, ack in MODES:
+        tmp = tempfile.mkdtemp(prefix="ledger-group-")
+        env = dict(os.environ, LEDGER_DB_PATH=os.path.join(tmp, "ledger.db"), OPENAI_API_KEY="bench",
+                   LEDGER_GROUP_COMMIT_MS=str(args.window_ms if window is None else window),
+                   LEDGER_INGEST_ACK=ack)
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--threads", str(args.threads),
+                              "--seconds", str(args.seconds), "--shops", str(args.shops)],
+                             env=env, capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        assert r["saved"] == r["requests"], f"{label}: {r['saved']} rows saved for {r['requests']} posts"
+        print(f"{label:<20}{r['requests_s']:>8.0f}{r['commits_s']:>11.0f}{r['p50']:>9.1f}{r['p99']:>9.1f}"
+              f"{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Rows/s and memory for streaming ledger import and export.
+
+    python bench/import_export.py [--rows 1000000] [--format csv|ndjson]
+
+Generates the upload on the fly (nothing is built in memory up front) and
+POSTs it to /api/user/<mobile>/import through the Flask test client
+against a throwaway database, then pulls the whole ledger back from
+/export and counts the rows. Peak anonymous RSS is printed for each
+phase; with streaming on both sides it should stay flat as --rows grows.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MOBILE = "9999900001"
+PRODUCTS = [f"Item {i} {size}" for i in range(400) for size in ("100 g", "500 g", "1 kg")]
+PEOPLE = [f"Customer {i}" for i in range(300)]
+
+
+class MemoryWatch:
+    """
+    Peak anonymous RSS (heap + SQLite page cache), sampled in the background.
+    Plain peak RSS would also count the database pages mapped in through the
+    pool's mmap_size, which grow with the file rather than with the work.
+    Falls back to ru_maxrss where /proc isn't available.
+    """
+
+    def __init__(self, interval=0.05):
+        self.peak = 0.0
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(interval,), daemon=True).start()
+
+    @staticmethod
+    def sample():
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("RssAnon:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.peak = max(self.peak, self.sample())
+
+    def reset(self):
+        self.peak = self.sample()
+        return self.peak
+
+
+def gen_lines(n, fmt, seed=7, pool=20000):
+    """n data lines cycling through a pool of random rows (so generating them isn't the bottleneck)."""
+    rnd = random.Random(seed)
+    rows = []
+    for _ in range(min(n, pool)):
+        day = f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T{rnd.randint(8, 21):02d}:{rnd.randint(0, 59):02d}:00Z"
+        credit = rnd.random() < 0.2
+        row = {"date": day, "product": rnd.choice(PRODUCTS), "units": rnd.randint(1, 5),
+               "revenue": rnd.randint(1, 60) * 10, "credit": credit,
+               "creditor": rnd.choice(PEOPLE) if credit else ""}
+        if fmt == "csv":
+            rows.append(f"{row['date']},{row['product']},{row['units']},{row['revenue']},{int(credit)},{row['creditor']}\n")
+        else:
+            rows.append(json.dumps(row) + "\n")
+    if fmt == "csv":
+        yield "date,product,units,revenue,credit,creditor\n"
+    for i in range(n):
+        yield rows[i % len(rows)]
+
+
+class GeneratedBody(io.RawIOBase):
+    """A read()-able request body produced line by line."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buf = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._buf:
+            self._buf = "".join(itertools.islice(self._lines, 512)).encode()
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ledger-bench-")
+    os.environ["LEDGER_DB_PATH"] = os.path.join(tmp, "ledger.db")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    import app  # noqa: E402  (reads LEDGER_DB_PATH at import)
+
+    client = app.app.test_client()
+    mem = MemoryWatch()
+    print(f"baseline anon RSS {mem.reset():.0f} MB")
+
+    t0 = time.perf_counter()
+    r = client.post(
+        f"/api/user/{MOBILE}/import?format={args.format}&import_id=bench",
+        # chunked-upload style: no Content-Length, the server reads to EOF
+        environ_overrides={"wsgi.input": io.BufferedReader(GeneratedBody(gen_lines(args.rows, args.format)), 1 << 16),
+                           "wsgi.input_terminated": True, "CONTENT_LENGTH": ""},
+    )
+    elapsed = time.perf_counter() - t0
+    res = r.get_json()
+    if r.status_code != 200:
+        sys.exit(f"import failed: {r.status_code} {res}")
+    print(f"import  {res['imported']:>9} rows  {elapsed:7.1f}s  {res['imported'] / elapsed:>9.0f} rows/s"
+          f"  rejected {res['rejected']}  peak anon RSS {mem.peak:.0f} MB")
+
+    mem.reset()
+    t0 = time.perf_counter()
+    r = client.get(f"/api/user/{MOBILE}/export?format={args.format}", buffered=False)
+    n = nbytes = 0
+    for chunk in r.response:
+        nbytes += len(chunk)
+        n += chunk.count(b"\n")
+    r.close()
+    elapsed = time.perf_counter() - t0
+    n -= args.format == "csv"  # header
+    print(f"export  {n:>9} rows  {elapsed:7.1f}s  {n / elapsed:>9.0f} rows/s"
+          f"  {nbytes / 2**20:.0f} MB  peak anon RSS {mem.peak:.0f} MB")
+    print(f"database {os.path.getsize(os.environ['LEDGER_DB_PATH']) / 2**20:.0f} MB in {tmp}")
+
+
+if __name__ == "__main__":
+    main()
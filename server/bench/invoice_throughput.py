@@ -0,0 +1,189 @@
+"""
+Invoices/s for the old per-request invoice builder vs. invoice_render.
+
+    python bench/invoice_throughput.py [--seconds 3] [--profiles 3]
+
+"legacy" is the pre-refactor /api/invoices body: reportlab imports, the
+stylesheet, table styles and the header closure rebuilt on every request.
+"cached" is invoice_render.render_invoice(). Both build the same document
+for 5-line and 200-line invoices, rotating through a few business profiles.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from invoice_render import _biz_from_payload, page_decorator, render_invoice  # noqa: E402
+
+
+def legacy_render(data):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
+    from reportlab.lib.enums import TA_LEFT, TA_RIGHT
+    from io import BytesIO
+    from decimal import Decimal, ROUND_HALF_UP
+
+    customer = (data.get("customer") or {}).get("name", "").strip()
+    items = data.get("items") or []
+    terms = (data.get("paymentTerms") or "").strip()
+    biz = _biz_from_payload(data)
+
+    def q2(val):
+        return Decimal(str(val)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    def fmt_inr(x):
+        return f"Rs. {q2(x)}"
+
+    rows = []
+    subtotal = Decimal("0"); gst_total = Decimal("0")
+    for i, it in enumerate(items, start=1):
+        desc = (it.get("description") or "").strip() or "-"
+        price = Decimal(str(it.get("price") or 0))
+        gstp = Decimal(str(it.get("gstPercent") or 0))
+        gst_amt = (price * gstp / Decimal("100"))
+        line_total = price + gst_amt
+        subtotal += price; gst_total += gst_amt
+        rows.append([str(i), desc, fmt_inr(price), f"{q2(gstp)}%", fmt_inr(gst_amt), fmt_inr(line_total)])
+    grand = subtotal + gst_total
+
+    now = datetime.now()
+    inv_date = now.strftime("%Y-%m-%d")
+    inv_no = now.strftime("INV%Y%m%d-%H%M%S")
+
+    buf = BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, leftMargin=16*mm, rightMargin=16*mm,
+                            topMargin=16*mm, bottomMargin=16*mm)
+    styles = getSampleStyleSheet()
+    H2 = ParagraphStyle('H2', parent=styles['Heading2'],
+                        fontName='Helvetica-Bold', fontSize=12, leading=16, alignment=TA_LEFT)
+    NORMAL = ParagraphStyle('NORMAL', parent=styles['Normal'], fontName='Helvetica', fontSize=10, leading=14)
+    RIGHT = ParagraphStyle('RIGHT', parent=styles['Normal'],
+                           fontName='Helvetica', fontSize=10, leading=14, alignment=TA_RIGHT)
+    brand = colors.HexColor("#0F766E")
+    band_h = 22*mm
+
+    def draw_page(canvas, _doc):
+        w, h = A4
+        canvas.saveState()
+        canvas.setFillColor(brand)
+        canvas.rect(0, h - band_h, w, band_h, fill=1, stroke=0)
+        canvas.setFillColor(colors.white)
+        canvas.setFont("Helvetica-Bold", 16)
+        canvas.drawString(16*mm, h - band_h + 7*mm, biz["store_name"])
+        y = h - band_h - 6*mm
+        canvas.setFillColor(colors.black)
+        canvas.setFont("Helvetica", 9)
+        line2 = []
+        if biz["store_address"]: line2.append(biz["store_address"])
+        if biz["store_gst"]: line2.append(f"GSTIN: {biz['store_gst']}")
+        if biz["store_contact"]: line2.append(f"Contact: {biz['store_contact']}")
+        if line2:
+            canvas.drawString(16*mm, y, "  |  ".join(line2))
+        canvas.setFont("Helvetica", 9)
+        canvas.setFillColor(colors.grey)
+        canvas.drawRightString(w - 16*mm, 12*mm, f"Page {_doc.page}")
+        canvas.drawString(16*mm, 12*mm, "Thank you for your business.")
+        canvas.restoreState()
+
+    story = [Spacer(1, band_h - 6*mm)]
+    meta_tbl = Table([
+        [Paragraph("<b>Invoice</b>", H2),
+         Paragraph(f"<b>Invoice No:</b> {inv_no}<br/><b>Date:</b> {inv_date}", RIGHT)],
+        [Paragraph(f"<b>Billed To</b><br/>{customer}", NORMAL), ""],
+    ], colWidths=[None, 60*mm])
+    meta_tbl.setStyle(TableStyle([("VALIGN", (0,0), (-1,-1), "TOP"), ("BOTTOMPADDING", (0,0), (-1,-1), 6)]))
+    story += [meta_tbl, Spacer(1, 6*mm)]
+
+    table_data = [["#", "Description", "Price", "GST %", "GST Amt", "Line Total"]] + rows
+    tbl = Table(table_data, colWidths=[10*mm, None, 26*mm, 18*mm, 26*mm, 30*mm], hAlign="LEFT", repeatRows=1)
+    tbl.setStyle(TableStyle([
+        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+        ("FONTSIZE", (0,0), (-1,0), 10),
+        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+        ("BACKGROUND", (0,0), (-1,0), brand),
+        ("ALIGN", (0,0), (0,-1), "CENTER"),
+        ("ALIGN", (2,1), (-1,-1), "RIGHT"),
+        ("ALIGN", (1,1), (1,-1), "LEFT"),
+        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+        ("INNERGRID", (0,0), (-1,-1), 0.25, colors.lightgrey),
+        ("BOX", (0,0), (-1,-1), 0.5, colors.grey),
+        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.whitesmoke, colors.Color(0.98,0.98,0.98)]),
+    ]))
+    story += [tbl, Spacer(1, 6*mm)]
+
+    totals = Table([["Subtotal", fmt_inr(subtotal)], ["GST Total", fmt_inr(gst_total)],
+                    ["Grand Total", fmt_inr(grand)]], colWidths=[40*mm, 35*mm], hAlign="RIGHT")
+    totals.setStyle(TableStyle([
+        ("FONTNAME", (0,0), (-1,-2), "Helvetica"),
+        ("FONTNAME", (0,-1), (-1,-1), "Helvetica-Bold"),
+        ("FONTSIZE", (0,0), (-1,-1), 11),
+        ("ALIGN", (0,0), (-1,-1), "RIGHT"),
+        ("BACKGROUND", (0,0), (-1,-1), colors.Color(0.99,0.99,1)),
+        ("BOX", (0,0), (-1,-1), 0.5, colors.HexColor("#A5B4FC")),
+        ("INNERGRID", (0,0), (-1,-1), 0.25, colors.Color(0.8,0.8,1)),
+        ("LEFTPADDING", (0,0), (-1,-1), 6),
+        ("RIGHTPADDING", (0,0), (-1,-1), 6),
+        ("TOPPADDING", (0,0), (-1,-1), 6),
+        ("BOTTOMPADDING", (0,0), (-1,-1), 6),
+    ]))
+    story.append(totals)
+    if terms:
+        story += [Spacer(1, 8*mm), Paragraph("<b>Payment Terms</b>", H2), Spacer(1, 1*mm), Paragraph(terms, NORMAL)]
+
+    doc.build(story, onFirstPage=draw_page, onLaterPages=draw_page)
+    return buf.getvalue()
+
+
+def make_job(n_lines, profile):
+    return {
+        "customer": {"name": "Neha Sharma"},
+        "items": [{"description": f"Item {i} - assorted groceries", "price": 40 + (i * 37) % 900,
+                   "gstPercent": (0, 5, 12, 18)[i % 4]} for i in range(n_lines)],
+        "paymentTerms": "Due within 15 days. UPI accepted.",
+        "business": {"store_name": f"Sharma General Store {profile}", "store_address": "12 MG Road, Pune",
+                     "store_gst": "27ABCDE1234F1Z5", "store_contact": "+91 70421 25595"},
+    }
+
+
+def rate(fn, jobs, seconds):
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        fn(jobs[n % len(jobs)])
+        n += 1
+    return n / (time.perf_counter() - t0)
+
+
+def best_rates(fns, jobs, seconds, rounds=5):
+    """Interleaved short rounds, best of each: shared-box noise hits both sides alike."""
+    best = [0.0] * len(fns)
+    for _ in range(rounds):
+        for k, fn in enumerate(fns):
+            best[k] = max(best[k], rate(fn, jobs, seconds / rounds))
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--profiles", type=int, default=3)
+    args = ap.parse_args()
+
+    cached = lambda job: render_invoice(job)[0]  # noqa: E731
+    print(f"{'lines':>6}{'legacy inv/s':>14}{'cached inv/s':>14}{'speedup':>9}{'pdf KB':>8}")
+    for n_lines in (5, 200):
+        jobs = [make_job(n_lines, p) for p in range(args.profiles)]
+        for job in jobs:  # warm imports and the per-profile cache for both sides
+            legacy_render(job); cached(job)
+        before, after = best_rates([legacy_render, cached], jobs, args.seconds)
+        size = len(cached(jobs[0])) / 1024
+        print(f"{n_lines:>6}{before:>14.1f}{after:>14.1f}{after / before:>8.2f}x{size:>8.1f}")
+    print(f"page_decorator cache: {page_decorator.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Parse-request latency and worker occupancy against a flaky stub LLM:
+the old blocking OpenAI client vs. LLMBackend (deadlines, jittered retries,
+bounded concurrency, circuit breaker).
+
+    python bench/llm_load.py [--requests 400] [--workers 8] [--fail-rate 0.05] [--hang-rate 0.03]
+
+"workers" stand in for gunicorn sync workers. All requests are queued at
+t=0, so latency includes time spent waiting for a free worker. Occupancy is
+the share of worker time spent blocked inside a request.
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from openai import OpenAI  # noqa: E402
+
+from llm_client import CircuitBreaker, LLMBackend, LLMUnavailable  # noqa: E402
+from message_parser import LLM_MODEL, SYSTEM_PROMPT  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import llm_stub  # noqa: E402
+
+MESSAGES = [
+    "sold 3 packets of biscuits to neha for 90",
+    "ramesh ko 500 ka saman udhar diya",
+    "2 maggi 28 and 1 colgate 55",
+    "yesterday's milk 40 40",
+]
+
+
+def pct(sorted_vals, p):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p))]
+
+
+def run(handle, n_requests, n_workers):
+    q = queue.Queue()
+    for i in range(n_requests):
+        q.put(MESSAGES[i % len(MESSAGES)])
+    t0 = time.perf_counter()
+    latencies, busy = [], [0.0] * n_workers
+    outcomes = {}
+    lock = threading.Lock()
+
+    def worker(w):
+        while True:
+            try:
+                msg = q.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            outcome = handle(msg)
+            end = time.perf_counter()
+            busy[w] += end - start
+            with lock:
+                latencies.append(end - t0)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(n_workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "wall": wall,
+        "rps": n_requests / wall,
+        "p50": pct(latencies, 0.50),
+        "p95": pct(latencies, 0.95),
+        "p99": pct(latencies, 0.99),
+        "occupancy": sum(busy) / (n_workers * wall),
+        "per_request_busy": sum(busy) / n_requests,
+        "outcomes": outcomes,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--latency-ms", type=float, default=250.0)
+    ap.add_argument("--fail-rate", type=float, default=0.05)
+    ap.add_argument("--hang-rate", type=float, default=0.03)
+    ap.add_argument("--hang-s", type=float, default=8.0)
+    ap.add_argument("--deadline", type=float, default=3.0)
+    args = ap.parse_args()
+
+    server, base_url = llm_stub.serve(latency_ms=args.latency_ms, fail_rate=args.fail_rate,
+                                      hang_rate=args.hang_rate, hang_s=args.hang_s)
+
+    def messages(msg):
+        return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": msg}]
+
+    legacy_client = OpenAI(api_key="stub", base_url=base_url)
+
+    def legacy(msg):
+        try:
+            legacy_client.chat.completions.create(model=LLM_MODEL, messages=messages(msg),
+                                                  temperature=0, max_tokens=300)
+            return "llm"
+        except Exception:
+            return "error"
+
+    backend = LLMBackend(api_key="stub", base_url=base_url, model=LLM_MODEL,
+                         max_concurrency=32, deadline=args.deadline, attempt_timeout=args.deadline / 2,
+                         breaker=CircuitBreaker(threshold=10, cooldown=2.0))
+
+    def pooled(msg):
+        try:
+            backend.complete(messages(msg))
+            return "llm"
+        except LLMUnavailable:
+            return "fallback"
+
+    results = [("blocking OpenAI client", run(legacy, args.requests, args.workers)),
+               ("LLMBackend", run(pooled, args.requests, args.workers))]
+    server.shutdown()
+
+    print(f"{args.requests} requests, {args.workers} workers, stub {args.latency_ms:.0f} ms, "
+          f"{args.fail_rate:.0%} 500s, {args.hang_rate:.0%} hangs of {args.hang_s:.0f}s")
+    print(f"{'client':<24}{'req/s':>8}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'busy/req s':>12}  outcomes")
+    for label, r in results:
+        print(f"{label:<24}{r['rps']:>8.1f}{r['p50']:>8.2f}{r['p95']:>8.2f}{r['p99']:>8.2f}"
+              f"{r['per_request_busy']:>12.3f}  {r['outcomes']}")
+    print(f"LLMBackend stats: {backend.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+    python bench/llm_stub.py --port 8099 --latency-ms 300 --fail-rate 0.05 --hang-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=stub flask run
+
+Answers POST /v1/chat/completions after a simulated delay. A configurable
+share of requests gets a 500 or hangs for --hang-s seconds. Replies use the
+local fast-path parser, so results look plausible. Batch prompts (numbered
+lines) get a "results" array back, and vendor bill prompts what
+bill_ingest's own patterns make of the text. With --replay
+bench/parse_replies.jsonl (bench/parser_accuracy.py --record), messages the
+real model answered get its recorded reply instead.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bill_ingest import parse_bill_text  # noqa: E402
+from message_parser import extract_json, fast_parse  # noqa: E402
+
+_NUMBERED = re.compile(r"^(\d+): (.*)$")
+
+
+def _key(text):
+    return " ".join(text.split())
+
+
+def _items_for(text, replay):
+    obj = extract_json(replay.get(_key(text)))
+    if obj is not None and isinstance(obj.get("items"), list):
+        return obj["items"]
+    res = fast_parse(text)
+    if res is not None:
+        return res.items
+    return [{"product": text[:40] or None, "units": 0, "revenue": 0, "credit": False, "creditor": None}]
+
+
+def _reply(user_text, batch, replay):
+    if batch:
+        results = []
+        for line in user_text.splitlines():
+            m = _NUMBERED.match(line)
+            if m:
+                results.append({"index": int(m.group(1)), "items": _items_for(m.group(2), replay)})
+        return json.dumps({"results": results})
+    if _key(user_text) in replay:
+        return replay[_key(user_text)]
+    return json.dumps({"items": _items_for(user_text, replay)})
+
+
+def load_replay(path):
+    """{message: raw reply} from parser_accuracy.py --record output."""
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return {_key(r["message"]): r["reply"] for r in rows if r.get("reply")}
+
+
+class StubConfig:
+    latency_ms = 300.0
+    jitter_ms = 100.0
+    fail_rate = 0.0
+    hang_rate = 0.0
+    hang_s = 30.0
+    replay = {}
+
+
+def make_handler(cfg):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_):
+            pass
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client gave up (timeout) while we were "thinking"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            r = random.random()
+            if r < cfg.hang_rate:
+                time.sleep(cfg.hang_s)
+            elif r < cfg.hang_rate + cfg.fail_rate:
+                time.sleep(cfg.latency_ms / 1000 / 4)
+                return self._send(500, {"error": {"message": "stub: simulated failure", "type": "server_error"}})
+            time.sleep(max(0.0, random.gauss(cfg.latency_ms, cfg.jitter_ms)) / 1000)
+
+            msgs = req.get("messages") or []
+            system = next((m["content"] for m in msgs if m.get("role") == "system"), "")
+            user = next((m["content"] for m in reversed(msgs) if m.get("role") == "user"), "")
+            if "VENDOR BILLS" in system:
+                content = json.dumps({k: v for k, v in parse_bill_text(user).items() if k != "source"})
+            else:
+                content = _reply(user, "BATCH MODE" in system, cfg.replay)
+            self._send(200, {
+                "id": "stub-1",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": req.get("model", "stub"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": len(system + user) // 4,
+                          "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(system + user) + len(content)) // 4},
+            })
+
+    return Handler
+
+
+def serve(port=0, **settings):
+    """Start the stub in a daemon thread; returns (server, base_url)."""
+    cfg = StubConfig()
+    for k, v in settings.items():
+        setattr(cfg, k, v)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(cfg))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--latency-ms", type=float, default=300.0)
+    ap.add_argument("--jitter-ms", type=float, default=100.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--hang-rate", type=float, default=0.0)
+    ap.add_argument("--hang-s", type=float, default=30.0)
+    ap.add_argument("--replay", help="recorded model replies (bench/parse_replies.jsonl)")
+    args = ap.parse_args()
+    server, url = serve(args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                        fail_rate=args.fail_rate, hang_rate=args.hang_rate, hang_s=args.hang_s,
+                        replay=load_replay(args.replay) if args.replay else {})
+    print(f"stub LLM listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Accuracy and latency of the local fast-path parser against the LLM's own outputs.
+
+    python bench/parser_accuracy.py --record   # ask the model, once (needs OPENAI_API_KEY)
+    python bench/parser_accuracy.py [-v]       # score fast_parse against the recorded replies
+
+bench/parse_corpus.jsonl holds the messages ({"message": ...} per line).
+--record sends each one to the model with SYSTEM_PROMPT, exactly as
+/api/parseMessage would, and writes the raw replies to
+bench/parse_replies.jsonl ({"message", "model", "reply"}); OPENAI_BASE_URL
+may point at any OpenAI-compatible endpoint, but not at bench/llm_stub.py,
+whose replies are fast_parse's own output (--record refuses it). Scoring
+reads the replies through extract_json + normalize_items, like the app,
+and compares every message the fast path accepts:
+
+  agree             same items as the model
+  false confidence  accepted at FASTPATH_MIN_CONFIDENCE or above, but not
+                    what the model says -- the entries the fast path would
+                    have got wrong instead of asking the model
+  too cautious      sent to the model, though the low-confidence local
+                    parse matched it
+
+Exits 1 when the false-confidence rate (of accepted, scored messages) is
+above --max-false-rate, and 2 when no message has a recorded reply.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from message_parser import (  # noqa: E402
+    FASTPATH_MIN_CONFIDENCE, LLM_MODEL, SYSTEM_PROMPT,
+    extract_json, fast_parse, normalize_items,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _norm_text(v):
+    return " ".join(str(v).split()).lower() if v else None
+
+
+def same_item(a, b):
+    return (
+        _norm_text(a.get("product")) == _norm_text(b.get("product"))
+        and int(a.get("units") or 0) == int(b.get("units") or 0)
+        and float(a.get("revenue") or 0) == float(b.get("revenue") or 0)
+        and bool(a.get("credit")) == bool(b.get("credit"))
+        and _norm_text(a.get("creditor")) == _norm_text(b.get("creditor"))
+    )
+
+
+def same_items(got, expected):
+    return len(got) == len(expected) and all(map(same_item, got, expected))
+
+
+def load(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def model_items(reply):
+    """The items /api/parseMessage would take from a raw reply, or None if it would reject it."""
+    obj = extract_json(reply) if reply else None
+    items = obj.get("items") if obj is not None else None
+    if not isinstance(items, list) or not all(isinstance(it, dict) for it in items):
+        return None
+    return normalize_items(items)
+
+
+def record(path, messages):
+    from openai import OpenAI
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None)
+    out = []
+    for msg in messages:
+        resp = client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "system", "content": SYSTEM_PROMPT},
+                      {"role": "user", "content": msg}],
+            temperature=0,
+            max_tokens=300,
+        )
+        if resp.id == "stub-1":
+            sys.exit("refusing to record bench/llm_stub.py: its replies are fast_parse's own")
+        out.append({"message": msg, "model": resp.model,
+                    "reply": resp.choices[0].message.content if resp.choices else None})
+        print(f"recorded: {msg}")
+    with open(path, "w", encoding="utf-8") as f:
+        for r in out:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--corpus", default=os.path.join(HERE, "parse_corpus.jsonl"))
+    ap.add_argument("--replies", default=os.path.join(HERE, "parse_replies.jsonl"))
+    ap.add_argument("--record", action="store_true", help="record the model's replies to --replies first")
+    ap.add_argument("--max-false-rate", type=float, default=0.0)
+    ap.add_argument("--repeat", type=int, default=200, help="timing iterations per message")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args()
+
+    messages = [c["message"] for c in load(args.corpus)]
+    if args.record:
+        record(args.replies, messages)
+    replies = {r["message"]: r for r in load(args.replies)}
+
+    counts = dict.fromkeys(("scored", "unusable", "accepted", "agree", "false", "cautious"), 0)
+    false_conf, timings = [], []
+    for msg in messages:
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            res = fast_parse(msg)
+        timings.append((time.perf_counter() - t0) / args.repeat)
+
+        accepted = res is not None and res.confidence >= FASTPATH_MIN_CONFIDENCE
+        rec = replies.get(msg)
+        expected = model_items(rec["reply"]) if rec else None
+        if rec is None:
+            verdict = "no reply recorded"
+        elif expected is None:
+            counts["unusable"] += 1
+            verdict = "model reply unusable"
+        else:
+            counts["scored"] += 1
+            if accepted:
+                counts["accepted"] += 1
+                if same_items(res.items, expected):
+                    counts["agree"] += 1
+                    verdict = "agree"
+                else:
+                    counts["false"] += 1
+                    false_conf.append((msg, res, expected))
+                    verdict = "FALSE CONFIDENCE"
+            elif res is not None and same_items(res.items, expected):
+                counts["cautious"] += 1
+                verdict = "too cautious"
+            else:
+                verdict = "model only"
+        if args.verbose:
+            how = f"fastpath ({res.rule}, {res.confidence:.2f})" if accepted else "llm"
+            print(f"{msg!r:48} -> {how:28} {verdict}")
+
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1e6
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e6
+    print(f"fast_parse latency over {len(messages)} messages: p50 {p50:.1f} us  p99 {p99:.1f} us")
+    if not counts["scored"]:
+        print(f"no usable model replies for the corpus in {args.replies}; "
+              "run with --record (OPENAI_API_KEY set) to score the fast path")
+        sys.exit(2)
+    false_rate = counts["false"] / counts["accepted"] if counts["accepted"] else 0.0
+    print(f"scored against the model: {counts['scored']}/{len(messages)} "
+          f"({counts['unusable']} unusable replies)  fast path accepted: {counts['accepted']}")
+    print(f"agree: {counts['agree']}  false confidence: {counts['false']} ({false_rate:.1%} of accepted)  "
+          f"too cautious: {counts['cautious']}")
+    for msg, res, exp in false_conf:
+        print(f"FALSE CONFIDENCE {msg!r} ({res.rule}, {res.confidence:.2f})\n"
+              f"  fast path {res.items}\n  model     {exp}")
+    sys.exit(1 if false_rate > args.max_false_rate else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Latency of /api/user/<mobile>/search on a multi-year ledger.
+
+    python bench/search.py [--years 4] [--neighbours 20] [--runs 50]
+
+Loads one shop with --years of seedgen entries (about 30k a year) plus
+--neighbours one-year shops on the same database file, through seed_shops
+into a throwaway database, then times a set of searches through the Flask
+test client: narrow and broad words, a customer, customer + product, one
+month, sort=date, and a deep page. Broad queries ("generic" matches most of
+the catalog) are the worst case: past SEARCH_RANK_MAX matches they are
+served newest first, a month at a time.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MOBILE = "7000000000"
+
+
+def pct(sorted_vals, p):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--years", type=int, default=4)
+    ap.add_argument("--neighbours", type=int, default=20)
+    ap.add_argument("--runs", type=int, default=50)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ledger-search-")
+    os.environ["LEDGER_DB_PATH"] = os.path.join(tmp, "ledger.db")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    import app  # noqa: E402  (reads LEDGER_DB_PATH at import)
+
+    first = date(date.today().year - args.years, date.today().month, 1)
+    t0 = time.perf_counter()
+    with app.app.app_context():
+        _, big = app.seed_shops([MOBILE], first, args.years * 12)
+        _, small = app.seed_shops([f"71{i:08d}" for i in range(args.neighbours)], first, 12, seed=1)
+        db = app.get_db(MOBILE)
+        last_month = db.execute(
+            "SELECT substr(MAX(day), 1, 7) FROM daily_rollups WHERE mobile = ?", (MOBILE,)).fetchone()[0]
+        # the shop's best credit customer, and something they bought
+        customer, product = db.execute(
+            "SELECT creditor, product FROM entries_named WHERE mobile = ? AND credit = 1 AND revenue > 0 "
+            "GROUP BY creditor ORDER BY COUNT(*) DESC LIMIT 1", (MOBILE,)).fetchone()
+    print(f"{big} rows in the shop, {small} in {args.neighbours} neighbours, loaded in "
+          f"{time.perf_counter() - t0:.1f}s")
+
+    month = f"from={last_month}-01&to={last_month}-28"
+    queries = [
+        ("product", "q=thums+up"),
+        ("customer", f"q={customer.replace(' ', '+')}"),
+        ("cust+product", f"q={customer.split()[0]}+{product.split()[0]}"),
+        ("prefix", "q=pep*"),
+        ("broad", "q=generic"),
+        ("broad, month", f"q=generic&{month}"),
+        ("vendor, month", f"q=rent&{month}"),
+        ("broad, by date", "q=generic&sort=date"),
+        ("broad, page 20", "q=generic&page=20"),
+    ]
+    client = app.app.test_client()
+    print(f"{'query':<16}{'p50 ms':>9}{'p99 ms':>9}{'items':>7}  more")
+    for label, qs in queries:
+        url = f"/api/user/{MOBILE}/search?{qs}"
+        body = client.get(url).get_json()
+        times = []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            r = client.get(url)
+            times.append(time.perf_counter() - t0)
+            assert r.status_code == 200, r.data
+        times.sort()
+        print(f"{label:<16}{pct(times, 0.5) * 1000:>9.2f}{pct(times, 0.99) * 1000:>9.2f}"
+              f"{len(body['items']):>7}  {body['more']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Write throughput vs. LEDGER_SHARDS: concurrent entry posts from several
+worker processes, with all shops in one file or spread over several.
+
+    python bench/shard_writes.py [--shards 1,2,4,8] [--workers 4] [--seconds 5] [--shops 64]
+
+Each worker process stands in for a gunicorn worker: it imports the app
+against a throwaway database and POSTs 1-3 item add_entries requests for
+random shops through the test client as fast as it can. With one file
+every commit queues on the same write lock (and SQLite's busy handler
+sleeps while it waits); with more shards only shops on the same file
+collide. Reports commits/s and latency percentiles per shard count.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PRODUCTS = [f"Item {i}" for i in range(200)]
+
+
+def pct(sorted_vals, p):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p))]
+
+
+def worker(seconds, shops, seed):
+    """Child: post entries until the deadline; prints latencies as JSON."""
+    import app  # noqa: E402  (reads LEDGER_DB_PATH / LEDGER_SHARDS at import)
+
+    client = app.app.test_client()
+    rnd = random.Random(seed)
+    mobiles = [f"93{i:08d}" for i in range(shops)]
+    latencies, errors = [], 0
+    start_at = float(os.environ["BENCH_START_AT"])
+    time.sleep(max(0.0, start_at - time.time()))
+    stop_at = time.perf_counter() + seconds
+    while time.perf_counter() < stop_at:
+        items = [{"product": rnd.choice(PRODUCTS), "units": 1, "revenue": rnd.randint(10, 500), "credit": False}
+                 for _ in range(rnd.randint(1, 3))]
+        t0 = time.perf_counter()
+        r = client.post(f"/api/user/{rnd.choice(mobiles)}/entries", json={"items": items})
+        if r.status_code == 200:
+            latencies.append(time.perf_counter() - t0)
+        else:
+            errors += 1
+    print(json.dumps({"latencies": latencies, "errors": errors}))
+
+
+def run(n_shards, n_workers, seconds, shops):
+    tmp = tempfile.mkdtemp(prefix="ledger-shards-")
+    env = dict(os.environ, LEDGER_DB_PATH=os.path.join(tmp, "ledger.db"), LEDGER_SHARDS=str(n_shards),
+               OPENAI_API_KEY="bench")
+    me = os.path.abspath(__file__)
+    # schema (every shard) once, before the workers race to it
+    subprocess.run([sys.executable, "-c", "import app"], cwd=os.path.dirname(os.path.dirname(me)), env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    env["BENCH_START_AT"] = str(time.time() + 2.0)  # after every worker has imported the app
+    procs = [subprocess.Popen([sys.executable, me, "--worker", "--seconds", str(seconds), "--shops", str(shops),
+                               "--seed", str(i)], env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+             for i in range(n_workers)]
+    latencies, errors = [], 0
+    for p in procs:
+        out, _ = p.communicate()
+        res = json.loads(out.decode().strip().splitlines()[-1])
+        latencies.extend(res["latencies"])
+        errors += res["errors"]
+    lat = sorted(latencies) or [0.0]
+    return {"commits_s": len(latencies) / seconds, "p50": pct(lat, 0.50) * 1000, "p99": pct(lat, 0.99) * 1000,
+            "max": lat[-1] * 1000, "errors": errors}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--shards", default="1,2,4,8")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--shops", type=int, default=64)
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--seed", type=int, default=0, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        return worker(args.seconds, args.shops, args.seed)
+
+    print(f"{args.workers} worker processes, {args.shops} shops, {args.seconds:.0f}s per run")
+    print(f"{'shards':>6}{'commits/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+    first = None
+    for n in [int(x) for x in args.shards.split(",") if x]:
+        r = run(n, args.workers, args.seconds, args.shops)
+        first = first or r["commits_s"]
+        print(f"{n:>6}{r['commits_s']:>11.0f}{r['p50']:>9.1f}{r['p99']:>9.1f}{r['max']:>9.1f}{r['errors']:>8}"
+              f"   x{r['commits_s'] / first:.2f}")
+
+
+if __name__ == "__main__":
+    main()
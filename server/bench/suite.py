@@ -0,0 +1,399 @@
+"""
+End-to-end load suite: seeded shops, concurrent HTTP clients, a stored baseline.
+
+    python bench/suite.py [--shops 20] [--months 3] [--clients 8] [--seconds 5]
+    python bench/suite.py --save-baseline      # write bench/baseline.json (this machine's)
+    python bench/suite.py --compare            # exit 1 if worse than the baseline
+
+Seeds a throwaway database with synthetic shops (app.seed_shops), starts
+the app in a child process on a threaded WSGI server with bench/llm_stub.py
+as its LLM, and runs each scenario in turn from --clients keep-alive
+connections:
+
+    add_entries    POST /api/user/<mobile>/entries, 1-3 items
+    list_entries   GET  /api/user/<mobile>/entries, newest page or one month
+    parse_message  POST /api/parseMessage, corpus messages, some made unique
+                   so they miss the parse cache and reach the stub LLM
+    invoices       POST /api/invoices, then poll status until done
+
+Latency for invoices is submit to done. Memory is the server's peak
+anonymous RSS (heap + SQLite page cache) while the scenario ran. Nothing
+leaves the machine.
+
+--compare fails a scenario when throughput drops, or p95 or memory grows,
+by more than --tolerance against the baseline (p95 also has to move by
+at least 2 ms, so sub-millisecond noise doesn't count).
+
+The numbers are absolute, so a baseline only means something on the
+machine that recorded it: bench/baseline.json is not checked in, and
+--save-baseline stores the host (CPU model and count, Python, SQLite)
+with the results. --compare refuses, with exit 2, when there is no
+baseline or it was recorded on a different host; --any-host compares
+anyway, as a rough guide.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+import llm_stub  # noqa: E402
+from seedgen import catalog  # noqa: E402
+
+BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+SCENARIOS = ("add_entries", "list_entries", "parse_message", "invoices")
+SEED_START = date(2025, 1, 1)
+P95_FLOOR_MS = 2.0
+
+
+def pct(sorted_vals, p):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p))]
+
+
+def host_info():
+    """What the numbers depend on; "node" is informational and not compared."""
+    cpu = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as f:
+            cpu = next((line.split(":", 1)[1].strip() for line in f if line.startswith("model name")), cpu)
+    except OSError:
+        pass
+    return {"node": platform.node(), "machine": platform.machine(), "cpu": cpu, "cpus": os.cpu_count(),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version}
+
+
+def same_host(a, b):
+    return a is not None and {k: v for k, v in a.items() if k != "node"} == {k: v for k, v in b.items() if k != "node"}
+
+
+def shop_mobiles(n):
+    return [f"95{i:08d}" for i in range(n)]
+
+
+def anon_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class PeakRSS:
+    """Peak anonymous RSS of another process, sampled in the background."""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid, self.peak = pid, 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.peak = max(self.peak, anon_rss_mb(self.pid))
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return max(self.peak, anon_rss_mb(self.pid))
+
+
+# ---------- Server side ----------
+def seed(n_shops, months):
+    """Load the shops with app.seed_shops (write_entries in large transactions)."""
+    import app  # noqa: E402  (reads LEDGER_DB_PATH at import)
+
+    t0 = time.perf_counter()
+    with app.app.app_context():
+        _, n = app.seed_shops(shop_mobiles(n_shops), SEED_START, months, seed=1)
+    return n, time.perf_counter() - t0
+
+
+def serve(port):
+    """Child process: the app on a threaded WSGI server, like a single gunicorn gthread worker."""
+    from werkzeug.serving import make_server
+
+    import app  # noqa: E402
+
+    make_server("127.0.0.1", port, app.app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, env):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"server exited with {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/metrics")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    sys.exit("server did not come up")
+
+
+# ---------- Clients ----------
+class Client:
+    """One keep-alive connection; reconnects after errors."""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            self.conn.request(method, path, body=None if body is None else json.dumps(body), headers=headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        return resp.status, data
+
+
+def letters(n):
+    """n as a lowercase word ("b", "ba", ...): a unique suffix without digits the parser would read as amounts."""
+    out = ""
+    while True:
+        n, r = divmod(n, 26)
+        out = chr(97 + r) + out
+        if not n:
+            return out
+
+
+def make_ops(mobiles, months, corpus, unique_share):
+    """Scenario name -> op(client, rnd, n) that raises on failure."""
+    cat = catalog()
+
+    def add_entries(c, rnd, n):
+        items = []
+        for _ in range(rnd.randint(1, 3)):
+            sku, price = rnd.choice(cat)
+            units = rnd.randint(1, 2)
+            items.append({"product": sku, "units": units, "revenue": price * units, "credit": False})
+        status, _ = c.request("POST", f"/api/user/{rnd.choice(mobiles)}/entries", {"items": items})
+        if status != 200:
+            raise RuntimeError(status)
+
+    def list_entries(c, rnd, n):
+        path = f"/api/user/{rnd.choice(mobiles)}/entries?limit=50"
+        if rnd.random() < 0.5:
+            m = SEED_START.month - 1 + rnd.randrange(months)
+            y, m = SEED_START.year + m // 12, m % 12 + 1
+            path += f"&from={y}-{m:02d}-01&to={y}-{m:02d}-28"
+        status, _ = c.request("GET", path)
+        if status != 200:
+            raise RuntimeError(status)
+
+    def parse_message(c, rnd, n):
+        msg = rnd.choice(corpus)
+        if rnd.random() < unique_share:
+            msg = f"{msg} {letters(n)}"
+        status, _ = c.request("POST", "/api/parseMessage", {"message": msg})
+        if status != 200:
+            raise RuntimeError(status)
+
+    def invoices(c, rnd, n):
+        lines = [{"description": sku, "price": price, "gstPercent": 18}
+                 for sku, price in rnd.sample(cat, rnd.randint(1, 8))]
+        status, data = c.request("POST", "/api/invoices",
+                                 {"customer": {"name": f"Customer {n}"}, "items": lines, "paymentTerms": "Net 15"})
+        if status != 202:
+            raise RuntimeError(status)
+        job_id = json.loads(data)["id"]
+        while True:
+            status, data = c.request("GET", f"/api/invoices/{job_id}/status")
+            state = json.loads(data)["status"] if status == 200 else None
+            if state == "done":
+                return
+            if state not in ("pending", "running"):
+                raise RuntimeError(state)
+            time.sleep(0.01)
+
+    return {"add_entries": add_entries, "list_entries": list_entries,
+            "parse_message": parse_message, "invoices": invoices}
+
+
+def run_scenario(op, port, pid, n_clients, seconds):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+    counter = iter(range(1 << 62))
+
+    def worker(i):
+        c, rnd = Client(port), random.Random(i)
+        mine, failed = [], 0
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            try:
+                op(c, rnd, next(counter))
+            except Exception:
+                failed += 1
+                continue
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    mem = PeakRSS(pid)
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    rss = mem.stop()
+
+    lat = sorted(latencies) or [0.0]
+    return {"requests": len(latencies), "errors": errors[0], "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(pct(lat, 0.50) * 1000, 2), "p95_ms": round(pct(lat, 0.95) * 1000, 2),
+            "p99_ms": round(pct(lat, 0.99) * 1000, 2), "rss_mb": round(rss, 1)}
+
+
+# ---------- Baseline ----------
+def load_baseline(host, any_host):
+    """bench/baseline.json, or exit 2 if there is none or (without any_host) it is from another host."""
+    if not os.path.exists(BASELINE):
+        print(f"no baseline at {BASELINE}; record one on this machine with --save-baseline")
+        sys.exit(2)
+    with open(BASELINE) as f:
+        base = json.load(f)
+    if not same_host(base.get("host"), host):
+        what = f"recorded on {base['host']}" if base.get("host") else "has no host recorded"
+        if not any_host:
+            print(f"baseline {what}; this is {host}. Re-record it here with --save-baseline "
+                  "(or pass --any-host to compare anyway)")
+            sys.exit(2)
+        print(f"warning: baseline {what}; comparing across hosts, treat the result as a rough guide")
+    return base
+
+
+def compare(base, results, config, tolerance):
+    """Regression messages against a baseline (empty when within tolerance)."""
+    if base.get("config") != config:
+        print(f"note: baseline was recorded with {base.get('config')}")
+    problems = []
+    for name, cur in results.items():
+        old = base.get("results", {}).get(name)
+        if old is None:
+            continue
+        if cur["rps"] < old["rps"] * (1 - tolerance):
+            problems.append(f"{name}: throughput {cur['rps']} req/s vs {old['rps']} baseline")
+        if cur["p95_ms"] > old["p95_ms"] * (1 + tolerance) and cur["p95_ms"] - old["p95_ms"] > P95_FLOOR_MS:
+            problems.append(f"{name}: p95 {cur['p95_ms']} ms vs {old['p95_ms']} baseline")
+        if cur["rss_mb"] > old["rss_mb"] * (1 + tolerance):
+            problems.append(f"{name}: peak anon RSS {cur['rss_mb']} MB vs {old['rss_mb']} baseline")
+        if cur["errors"] and not old["errors"]:
+            problems.append(f"{name}: {cur['errors']} errors (baseline had none)")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--shops", type=int, default=20)
+    ap.add_argument("--months", type=int, default=3)
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--llm-latency-ms", type=float, default=50.0)
+    ap.add_argument("--unique-share", type=float, default=0.5, help="share of parse messages that miss the cache")
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--compare", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.5)
+    ap.add_argument("--any-host", action="store_true", help="--compare against a baseline from another machine")
+    ap.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.serve:
+        return serve(args.serve)
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    host = host_info()
+    # before the run, so a compare that can't happen doesn't cost one
+    base = load_baseline(host, args.any_host) if args.compare else None
+
+    tmp = tempfile.mkdtemp(prefix="ledger-suite-")
+    stub, base_url = llm_stub.serve(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_latency_ms / 4)
+    os.environ.update({
+        "LEDGER_DB_PATH": os.path.join(tmp, "ledger.db"),
+        "LEDGER_INVOICE_DIR": os.path.join(tmp, "invoices"),
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": base_url,
+    })
+
+    rows, seconds = seed(args.shops, args.months)
+    print(f"seeded {args.shops} shops x {args.months} months: {rows} entries "
+          f"in {seconds:.1f}s ({rows / seconds:.0f} rows/s)")
+
+    with open(os.path.join(BENCH_DIR, "parse_corpus.jsonl")) as f:
+        corpus = [json.loads(line)["message"] for line in f if line.strip()]
+    ops = make_ops(shop_mobiles(args.shops), args.months, corpus, args.unique_share)
+
+    port = free_port()
+    proc = start_server(port, os.environ.copy())
+    results = {}
+    try:
+        print(f"{'scenario':<14}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'RSS MB':>8}")
+        for name in scenarios:
+            r = results[name] = run_scenario(ops[name], port, proc.pid, args.clients, args.seconds)
+            print(f"{name:<14}{r['rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+                  f"{r['errors']:>8}{r['rss_mb']:>8}")
+    finally:
+        proc.terminate()
+        proc.wait()
+        stub.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    config = {"shops": args.shops, "months": args.months, "clients": args.clients,
+              "seconds": args.seconds, "llm_latency_ms": args.llm_latency_ms, "unique_share": args.unique_share}
+    if args.save_baseline:
+        with open(BASELINE, "w") as f:
+            json.dump({"host": host, "config": config, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {BASELINE}")
+    if args.compare:
+        problems = compare(base, results, config, args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            sys.exit(1)
+        print(f"within {args.tolerance:.0%} of baseline")
+
+
+if __name__ == "__main__":
+    main()
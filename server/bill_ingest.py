@@ -0,0 +1,391 @@
+"""
+Vendor bill ingestion for POST /api/ingestInvoice.
+
+An upload is written straight into the bill store while it's hashed
+(BillSpool is the form parser's file stream, so a bill never sits in
+memory) and kept once per sha256, unless nothing can be read from it.
+Extraction is cached under the same hash in the bills table, and
+concurrent uploads of one file share a run:
+
+  1. text layer: pypdf reads the PDF's text in a process pool (it is pure
+     Python, so threads would queue on the GIL) and parse_bill_text()
+     picks out the vendor, line items and total;
+  2. model: when the items don't account for the total -- a scanned bill,
+     a layout the patterns don't know -- model(text, path) gets a turn.
+     The app plugs in its LLM; bench/llm_stub.py answers that locally.
+
+A result is {"vendor", "bill_no", "bill_date", "items": [{"description",
+"units", "amount"}], "total_amount", "source": "text" | "model"}, amounts
+in whole rupees like entry revenue.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from pypdf import PdfReader
+
+MAX_PAGES = 20
+
+BILL_SYSTEM_PROMPT = """You read VENDOR BILLS (purchase invoices) for an Indian kirana shop.
+The user message is the text layer of one bill. Reply with JSON only:
+{"vendor": str|null, "bill_no": str|null, "bill_date": "YYYY-MM-DD"|null,
+ "items": [{"description": str, "units": int, "amount": number}], "total_amount": number|null}
+vendor is the business that issued the bill, not the buyer. amount is each line's total
+including tax; total_amount is the amount payable. Use null for anything not on the bill."""
+
+
+class BillTooLarge(Exception):
+    # not a ValueError: werkzeug's form parser swallows those and hands back an empty form
+    pass
+
+
+def blob_path(root, digest):
+    return os.path.join(root, digest[:2], digest)
+
+
+class BillSpool:
+    """
+    Writable temp file in the store that hashes whatever is written to it;
+    Flask's form parser streams the upload into it. Raises BillTooLarge
+    past max_bytes, which aborts the parse.
+    """
+
+    def __init__(self, tmp_dir, max_bytes):
+        fd, self.path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        self._f = os.fdopen(fd, "w+b")
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise BillTooLarge(f"bill is larger than {self.max_bytes // 2**20} MB")
+        self._hash.update(data)
+        return self._f.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def discard(self):
+        self._f.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __getattr__(self, name):  # read/seek/close for werkzeug's FileStorage
+        return getattr(self._f, name)
+
+
+# ---------- text layer ----------
+_AMOUNT = re.compile(r"(?:(?:rs\.?|inr|₹)\s*(-?\d[\d,]*(?:\.\d+)?)|(-?\d[\d,]*\.\d{2}))(?![\d%])", re.I)
+_TOTAL = re.compile(r"\b(?:grand\s+total|total\s+amount|amount\s+payable|net\s+payable|total\s+due|total)\b", re.I)
+_NOT_TOTAL = re.compile(r"^\s*(?:sub\s*-?\s*total|[csi]?gst|tax|vat)", re.I)
+_INDEX = re.compile(r"^(\d{1,3})[.)]?$")
+_INDEXED_ROW = re.compile(r"^(\d{1,3})[.)]?\s+(\S.*)$")
+_UNITS = re.compile(r"^\d{1,4}$")
+_TRAILING_UNITS = re.compile(r"^(.*\S)\s+(\d{1,4})$")
+_VENDOR_LABEL = re.compile(r"^(?:vendor|supplier|sold\s+by|seller|from)\s*[:\-]\s*(.+)$", re.I)
+_NOT_VENDOR = re.compile(r"^(?:tax\s+)?(?:invoice|bill|receipt|estimate|page\s+\d)|^#|gstin|phone|contact|date|"
+                         r"thank you", re.I)
+_BILL_NO = re.compile(r"\b(?:invoice|bill)\s*(?:no\.?|number|#)\s*[:\-]?\s*([A-Z0-9][\w/-]*)", re.I)
+_BILL_DATE = re.compile(r"\bdate\s*[:\-]?\s*(\d{4}-\d\d-\d\d)", re.I)
+
+
+def rupees(value):
+    """'1,234.50' / 1234.5 -> 1235 (half up); None if it isn't a number."""
+    try:
+        return int(Decimal(str(value).replace(",", "")).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _amounts(line):
+    return [rupees(a or b) for a, b in _AMOUNT.findall(line)]
+
+
+def _row_item(cells):
+    """One table row's cells -> item, or None if no amount is on it."""
+    amounts = [a for c in cells for a in _amounts(c)]
+    if not amounts or amounts[-1] <= 0:
+        return None
+    description, units = None, 1
+    for c in cells:
+        if description is None:
+            head = _AMOUNT.split(c, maxsplit=1)[0].strip(" -:|")
+            if head and not _UNITS.match(head) and not head.endswith("%"):
+                description = head
+        elif _UNITS.match(c):
+            units = int(c) or 1  # a quantity column after the description
+            break
+        elif _amounts(c):
+            break
+    if len(cells) == 1 and description and len(amounts) >= 2:
+        # "Sugar 10 kg  2  480.00  960.00": a quantity before rate and total
+        m = _TRAILING_UNITS.match(description)
+        if m:
+            description, units = m.group(1), int(m.group(2)) or 1
+    return {"description": description or "Bill item", "units": units, "amount": amounts[-1]}
+
+
+def parse_bill_text(text):
+    """Vendor, line items and total from a bill's text layer, by pattern."""
+    lines = [ln.strip() for ln in (text or "").splitlines() if ln.strip()]
+
+    vendor = next((m.group(1).strip() for m in map(_VENDOR_LABEL.match, lines) if m), None)
+    if vendor is None:
+        vendor = next((ln for ln in lines[:8]
+                       if not _NOT_VENDOR.search(ln) and not _amounts(ln) and len(ln) <= 80), None)
+
+    total = None
+    for i, ln in enumerate(lines):
+        if _TOTAL.search(ln) and not _NOT_TOTAL.match(ln):
+            found = _amounts(ln) or (_amounts(lines[i + 1]) if i + 1 < len(lines) else [])
+            if found:
+                total = found[-1]  # the last total on a bill is the one payable
+
+    # Rows are numbered 1, 2, 3...: either one line each, or (a table's text
+    # layer) one cell per line after a bare index. A number only starts the
+    # next row once the current one has an amount, so a quantity cell that
+    # happens to equal the next index stays in its row.
+    items, row, expect = [], None, 1
+    for ln in lines:
+        complete = row is None or any(_amounts(c) for c in row)
+        m = _INDEX.match(ln) or _INDEXED_ROW.match(ln)
+        if m and int(m.group(1)) == expect and complete:
+            if row:
+                items.append(_row_item(row))
+            row = [m.group(2)] if m.re is _INDEXED_ROW else []
+            expect += 1
+        elif row is not None:
+            if _TOTAL.match(ln) or _NOT_TOTAL.match(ln):
+                items.append(_row_item(row))
+                row = None
+                continue
+            row.append(ln)
+    if row:
+        items.append(_row_item(row))
+
+    m, d = _BILL_NO.search(text or ""), _BILL_DATE.search(text or "")
+    return {
+        "vendor": vendor,
+        "bill_no": m.group(1) if m else None,
+        "bill_date": d.group(1) if d else None,
+        "items": [it for it in items if it],
+        "total_amount": total,
+        "source": "text",
+    }
+
+
+def accounts_for_total(result):
+    """True when the items add up to the total (within a rupee of rounding per line)."""
+    items, total = result["items"], result["total_amount"]
+    return bool(items) and total is not None and abs(sum(it["amount"] for it in items) - total) <= len(items)
+
+
+def normalize_bill(raw, source="model"):
+    """A model's reply, coerced to a result's shape (bad lines dropped)."""
+    raw = raw if isinstance(raw, dict) else {}
+    items = []
+    for it in raw.get("items") or []:
+        if not isinstance(it, dict):
+            continue
+        amount = rupees(it.get("amount"))
+        if amount is None or amount <= 0:
+            continue
+        units = rupees(it.get("units")) or 1
+        items.append({"description": str(it.get("description") or "Bill item").strip()[:120],
+                      "units": max(units, 1), "amount": amount})
+    total = rupees(raw.get("total_amount")) if raw.get("total_amount") is not None else None
+    return {
+        "vendor": (str(raw["vendor"]).strip() or None) if raw.get("vendor") else None,
+        "bill_no": str(raw["bill_no"]) if raw.get("bill_no") else None,
+        "bill_date": str(raw["bill_date"]) if raw.get("bill_date") else None,
+        "items": items,
+        "total_amount": total,
+        "source": source,
+    }
+
+
+def extract_text(path, max_pages=MAX_PAGES):
+    """Runs in a pool process: the PDF's text layer ('' if it has none). Raises ValueError if unreadable."""
+    try:
+        reader = PdfReader(path)
+        return "\n".join(page.extract_text() or "" for page in reader.pages[:max_pages])
+    except Exception as e:  # pypdf raises a variety of errors on damaged files
+        raise ValueError(f"not a readable PDF ({e.__class__.__name__})") from None
+
+
+# ---------- pipeline ----------
+class BillIngest:
+    def __init__(self, get_conn, root, model=None, max_workers=2, max_bytes=20 * 2**20, observe=None):
+        self._get_conn = get_conn
+        self.root = root
+        # model(text, path) -> dict like a result (any subset), or None; may raise
+        self.model = model
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        # observe(source, seconds) per extraction; source is text | model | failed
+        self.observe = observe
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._threads = None
+        self._inflight = {}  # sha256 -> Future
+        self.stats = {"uploads": 0, "stored": 0, "extracted": 0, "cache_hits": 0, "shared": 0,
+                      "model_calls": 0, "failed": 0, "dropped": 0, "pool_restarts": 0}
+
+    def _bump(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    # -- storage
+    def spool(self):
+        tmp = os.path.join(self.root, "tmp")
+        os.makedirs(tmp, exist_ok=True)
+        return BillSpool(tmp, self.max_bytes)
+
+    def keep(self, spool):
+        """Move a finished upload into the store under its sha256 (dropping it if that's there already)."""
+        digest = spool.hexdigest()
+        path = blob_path(self.root, digest)
+        spool.close()
+        with self._lock:  # against _run() dropping the blob of a failed bill
+            if os.path.exists(path):
+                spool.discard()
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(spool.path, path)
+                self.stats["stored"] += 1
+            self.stats["uploads"] += 1
+        return digest, path
+
+    # -- pools (created lazily so forked gunicorn workers each get their own)
+    def _executors(self):
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is None or self._pool_pid != pid:
+                methods = multiprocessing.get_all_start_methods()
+                ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers * 2, thread_name_prefix="bills")
+                self._pool_pid = pid
+            return self._pool, self._threads
+
+    def _text(self, path):
+        with open(path, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                return ""  # an image or anything else: only the model can read it
+        for attempt in range(2):
+            pool = self._executors()[0]
+            try:
+                return pool.submit(extract_text, path).result()
+            except BrokenProcessPool:
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                        self.stats["pool_restarts"] += 1
+                if attempt:
+                    raise
+
+    # -- extraction
+    def cached(self, digest):
+        row = self._get_conn().execute("SELECT result FROM bills WHERE sha256 = ?", (digest,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def extract(self, digest, path):
+        """
+        Future for the bill's result; resolves at once when it's cached, and
+        is shared with any extraction of the same file already running.
+        Fails with ValueError for a bill nothing could be read from.
+        """
+        hit = self.cached(digest)
+        if hit is not None:
+            self._bump("cache_hits")
+            fut = Future()
+            fut.set_result(hit)
+            return fut
+        with self._lock:
+            fut = self._inflight.get(digest)
+            if fut is not None:
+                self.stats["shared"] += 1
+                return fut
+            fut = self._inflight[digest] = Future()
+            if not os.path.exists(path):  # a failed run of the same file dropped it after keep()
+                self._inflight.pop(digest)
+                fut.set_exception(ValueError("couldn't read this bill; upload it again"))
+                return fut
+        self._executors()[1].submit(self._run, digest, path, fut)
+        return fut
+
+    def _run(self, digest, path, fut):
+        t0 = time.perf_counter()
+        source = "failed"
+        try:
+            text = self._text(path)
+            result = parse_bill_text(text)
+            if not accounts_for_total(result) and self.model is not None:
+                self._bump("model_calls")
+                try:
+                    found = self.model(text, path)
+                except Exception as e:
+                    print(f"[bills] model failed on {digest[:12]}: {e!r}")
+                    found = None
+                if found:
+                    guess = normalize_bill(found)
+                    if guess["total_amount"] is not None or guess["items"]:
+                        for k in ("vendor", "bill_no", "bill_date"):
+                            guess[k] = guess[k] or result[k]
+                        result = guess
+            if result["total_amount"] is None and result["items"]:
+                result["total_amount"] = sum(it["amount"] for it in result["items"])
+            if not result["total_amount"] or result["total_amount"] <= 0:
+                raise ValueError("couldn't find a total on this bill")
+            if not accounts_for_total(result):
+                # what we can vouch for is the total: record it as one line
+                label = f"Bill {result['bill_no']}" if result["bill_no"] else "Vendor bill"
+                result["items"] = [{"description": label, "units": 1, "amount": result["total_amount"]}]
+            db = self._get_conn()
+            db.execute("INSERT OR REPLACE INTO bills (sha256, size, result, created_at) VALUES (?, ?, ?, ?)",
+                       (digest, os.path.getsize(path), json.dumps(result), time.time()))
+            db.commit()
+            source = result["source"]
+            self._bump("extracted")
+            fut.set_result(result)
+        except Exception as e:
+            self._bump("failed")
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+                if source == "failed":
+                    self._drop(digest, path)
+            if self.observe is not None:
+                self.observe(source, time.perf_counter() - t0)
+
+    def _drop(self, digest, path):
+        """Remove a blob no bills row points at (its extraction failed); called under _lock."""
+        try:
+            if self._get_conn().execute("SELECT 1 FROM bills WHERE sha256 = ?", (digest,)).fetchone() is None:
+                os.remove(path)
+                self.stats["dropped"] += 1
+        except Exception as e:  # a stray blob is only disk space; never fail the request over it
+            print(f"[bills] couldn't drop {digest[:12]}: {e!r}")
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["in_flight"] = len(self._inflight)
+        out["bills"] = self._get_conn().execute("SELECT COUNT(*) FROM bills").fetchone()[0]
+        out["max_workers"] = self.max_workers
+        out["store"] = self.root
+        return out
@@ -0,0 +1,160 @@
+"""
+Columnar (Arrow / Parquet) copies of ledger entries, for analysis outside the app.
+
+Rows come off a SQLite cursor COLUMNAR_CHUNK at a time and go straight
+into typed Arrow arrays -- one pa.array() per column per chunk, no
+per-row dicts or bool() calls -- so memory stays at about one chunk
+whatever the ledger's size. Two ways out:
+
+  stream()         one shop's entries as an Arrow IPC stream or a Parquet
+                   file, written chunk by chunk into the response. The IPC
+                   body is the column buffers themselves, so a reader maps
+                   them as-is (pa.ipc.open_stream, pyarrow/polars/duckdb).
+  DatasetWriter    a hive-partitioned directory, mobile=<m>/month=<YYYY-MM>/,
+                   one file per shop-month per shard, for `flask
+                   export-columnar`. Rows must arrive ordered by mobile and
+                   date, so only one partition file is open at a time.
+
+Dates are stored as text (DATE_FMT); here they become UTC timestamps.
+"""
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+COLUMNAR_CHUNK = 50_000
+FORMATS = ("arrow", "parquet")
+COLUMNS = ("id", "date", "product", "units", "revenue", "credit", "creditor")
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("date", pa.timestamp("s", tz="UTC")),
+    ("product", pa.string()),
+    ("units", pa.int64()),
+    ("revenue", pa.int64()),
+    ("credit", pa.bool_()),
+    ("creditor", pa.string()),
+])
+MIMETYPES = {"arrow": "application/vnd.apache.arrow.stream", "parquet": "application/vnd.apache.parquet"}
+EXTENSIONS = {"arrow": "arrow", "parquet": "parquet"}
+_STORED_DATE = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def to_batch(cols):
+    """A RecordBatch in SCHEMA from column sequences in COLUMNS order (date as stored text)."""
+    ids, dates, products, units, revenue, credit, creditors = cols
+    return pa.record_batch([
+        pa.array(ids, pa.int64()),
+        pc.strptime(pa.array(dates, pa.string()), format=_STORED_DATE, unit="s").cast(SCHEMA.field("date").type),
+        pa.array(products, pa.string()),
+        pa.array(units, pa.int64()),
+        pa.array(revenue, pa.int64()),
+        pc.not_equal(pa.array(credit, pa.int64()), 0),
+        pa.array(creditors, pa.string()),
+    ], schema=SCHEMA)
+
+
+def batches(cursor, chunk=COLUMNAR_CHUNK):
+    """RecordBatches from a cursor over COLUMNS."""
+    while True:
+        rows = cursor.fetchmany(chunk)
+        if not rows:
+            return
+        yield to_batch(list(zip(*rows)))
+
+
+class _Chunks:
+    """Write-only file object that keeps what it's given until taken (pa.PythonFile wraps it)."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._size = 0
+
+    def write(self, data):
+        self._parts.append(data)
+        self._size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._size
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+def stream(cursor, fmt, chunk=COLUMNAR_CHUNK):
+    """Bytes of an Arrow IPC stream or Parquet file over a cursor on COLUMNS, one piece per chunk."""
+    out = _Chunks()
+    sink = pa.PythonFile(out, mode="w")
+    writer = (pq.ParquetWriter(sink, SCHEMA, compression="zstd") if fmt == "parquet"
+              else pa.ipc.new_stream(sink, SCHEMA))
+    for batch in batches(cursor, chunk):
+        writer.write_batch(batch)
+        piece = out.take()
+        if piece:
+            yield piece
+    writer.close()
+    yield out.take()
+
+
+class DatasetWriter:
+    """
+    Writes (mobile, *COLUMNS) rows ordered by mobile, date into
+    root/mobile=<m>/month=<YYYY-MM>/part-<part>.<ext>, replacing files a
+    previous run left there. mobile and month live in the path, not the file.
+    """
+
+    def __init__(self, root, fmt="parquet", part=0):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        self.root = root
+        self.fmt = fmt
+        self.part = part
+        self.partitions = 0
+        self.rows = 0
+        self._key = None
+        self._writer = None
+
+    def _open(self, key):
+        self.close()
+        mobile, month = key.rsplit("/", 1)
+        d = os.path.join(self.root, f"mobile={mobile}", f"month={month}")
+        os.makedirs(d, exist_ok=True)
+        path = os.path.join(d, f"part-{self.part}.{EXTENSIONS[self.fmt]}")
+        self._writer = (pq.ParquetWriter(path, SCHEMA, compression="zstd") if self.fmt == "parquet"
+                        else pa.ipc.new_file(path, SCHEMA))
+        self._key = key
+        self.partitions += 1
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        cols = list(zip(*rows))
+        batch = to_batch(cols[1:])
+        # one run per shop-month; the rows are sorted, so runs are whole partitions
+        keys = pc.binary_join_element_wise(pa.array(cols[0], pa.string()),
+                                           pc.utf8_slice_codeunits(pa.array(cols[2], pa.string()), 0, 7), "/")
+        runs = pc.run_end_encode(keys)
+        start = 0
+        for end, key in zip(runs.run_ends.to_pylist(), runs.values.to_pylist()):
+            if key != self._key:
+                self._open(key)
+            self._writer.write_batch(batch.slice(start, end - start))
+            start = end
+        self.rows += len(rows)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._key = None
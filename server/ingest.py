@@ -0,0 +1,150 @@
+"""
+Group commit for entry posts.
+
+With it on, add_entries doesn't commit its own rows: it queues them, and a
+flusher thread writes everything queued by this process's request threads
+in one transaction per shard -- at most max_delay after the first arrival,
+or as soon as max_rows are waiting. One commit (and, for "sync", one
+fsync) then covers a whole burst of chat messages instead of one each.
+
+What a request waits for before it is answered (its ack):
+
+    queued  the rows are in this process's queue; lost if it dies first
+    commit  the group holding them has committed: as durable as the
+            database's own synchronous setting (WAL + NORMAL survives a
+            crashed process, not necessarily a power cut)
+    sync    as commit, but that group is committed with synchronous=FULL,
+            so the WAL is on disk before anyone in it is answered
+
+A group is synced if any request in it asked for sync. If a group's
+transaction fails, its requests are retried one by one so a single bad
+batch can't fail its neighbours.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+ACKS = ("queued", "commit", "sync")
+
+
+class IngestBuffer:
+    def __init__(self, write, max_delay=0.005, max_rows=500, observe=None):
+        # write(key, rows, sync): insert and commit rows on shard `key` in one
+        # transaction, on the calling (flusher) thread; raises on failure
+        self._write = write
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        # observe(requests, rows, seconds) per committed group
+        self.observe = observe
+        self._cond = threading.Condition()
+        self._busy = False  # the flusher has taken a batch it hasn't finished writing
+        self._items = []  # (key, rows, sync, future, queued_at)
+        self._rows = 0
+        self._thread = None
+        self._pid = None
+        self.stats = {"requests": 0, "rows": 0, "commits": 0, "retried": 0, "failed": 0}
+
+    def _ensure_thread(self):
+        # started lazily (and again after a fork) so each gunicorn worker has its own flusher
+        if self._thread is None or self._pid != os.getpid():
+            self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def submit(self, key, rows, ack="commit"):
+        """
+        Queue rows for shard `key`. Returns a Future that resolves to the row
+        count once they're committed (or raises the write's error). Callers
+        with ack="queued" needn't wait on it.
+        """
+        if ack not in ACKS:
+            raise ValueError(f"ack must be one of {', '.join(ACKS)}")
+        fut = Future()
+        with self._cond:
+            self._ensure_thread()
+            self._items.append((key, rows, ack == "sync", fut, time.perf_counter()))
+            self._rows += len(rows)
+            self.stats["requests"] += 1
+            if len(self._items) == 1 or self._rows >= self.max_rows:
+                self._cond.notify_all()
+        return fut
+
+    def _take(self):
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            deadline = self._items[0][4] + self.max_delay
+            while self._rows < self.max_rows:
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            batch, self._items, self._rows = self._items, [], 0
+            self._busy = True
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            try:
+                self._flush(batch)
+            except Exception as e:  # keep the flusher alive; anyone unanswered gets the error
+                print(f"[ingest] flush failed: {e!r}")
+                for item in batch:
+                    if not item[3].done():
+                        item[3].set_exception(e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def drain(self):
+        """Wait out a flush in progress, then write whatever is queued on the calling thread (shutdown, tests)."""
+        with self._cond:
+            while self._busy:
+                self._cond.wait()
+            batch, self._items, self._rows = self._items, [], 0
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[0], []).append(item)
+        for key, items in groups.items():
+            rows = [r for item in items for r in item[1]]
+            t0 = time.perf_counter()
+            try:
+                self._write(key, rows, any(item[2] for item in items))
+            except Exception as e:
+                print(f"[ingest] group of {len(items)} requests on shard {key} failed ({e!r}); retrying singly")
+                self._retry(key, items)
+                continue
+            self._bump(commits=1, rows=len(rows))
+            if self.observe is not None:
+                self.observe(len(items), len(rows), time.perf_counter() - t0)
+            for item in items:
+                item[3].set_result(len(item[1]))
+
+    def _retry(self, key, items):
+        for _key, rows, sync, fut, _t in items:
+            try:
+                self._write(key, rows, sync)
+            except Exception as e:
+                print(f"[ingest] {len(rows)} rows on shard {key} not saved: {e!r}")
+                self._bump(failed=1)
+                fut.set_exception(e)
+            else:
+                self._bump(commits=1, rows=len(rows), retried=1)
+                fut.set_result(len(rows))
+
+    def _bump(self, **counts):
+        with self._cond:
+            for k, n in counts.items():
+                self.stats[k] += n
+
+    def snapshot(self):
+        with self._cond:
+            return {**self.stats, "queued": len(self._items), "max_delay_ms": self.max_delay * 1000,
+                    "max_rows": self.max_rows}
@@ -0,0 +1,222 @@
+"""
+Background invoice rendering.
+
+POST /api/invoices records a job row and hands the payload to a process
+pool, so the request returns as soon as the row is committed and large
+invoices never hold a Flask worker. Workers write the PDF under the store
+directory named by its sha256 (identical output is kept once); the hash is
+saved on the row and doubles as the download's ETag.
+
+Invoice numbers come from the row's AUTOINCREMENT seq, so concurrent
+requests -- across threads or gunicorn workers -- never share one. Public
+ids are random uuid4 hex, so download URLs can't be enumerated.
+
+A pending job records the pid that dispatched it. If that process is gone
+(a crash, then a restart) or the job has been pending for stale_after
+seconds, it is requeued by recover() at startup, or by get() the next time
+its status is polled.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from invoice_render import render_invoice, validate_invoice
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # someone else's process
+    return True
+
+
+def blob_path(root, digest):
+    return os.path.join(root, digest[:2], digest + ".pdf")
+
+
+def _render_to_store(payload, invoice_no, now, root):
+    """Runs in a pool process: render, hash, write atomically. Returns (sha256, size, render seconds)."""
+    t0 = time.perf_counter()
+    pdf, _meta = render_invoice(payload, invoice_no=invoice_no, now=now)
+    render_s = time.perf_counter() - t0
+    digest = hashlib.sha256(pdf).hexdigest()
+    path = blob_path(root, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(pdf)
+        os.replace(tmp, path)
+    return digest, len(pdf), render_s
+
+
+class InvoiceQueue:
+    def __init__(self, get_conn, root, max_workers=2, stale_after=300.0, observe=None):
+        self._get_conn = get_conn
+        self.root = root
+        self.max_workers = max_workers
+        self.stale_after = stale_after
+        # observe(status, render_seconds, job_seconds) per finished job; job
+        # time runs from dispatch, so it includes waiting for a pool worker
+        self.observe = observe
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "done": 0, "failed": 0, "recovered": 0, "pool_restarts": 0}
+
+    # -- pool (created lazily so forked gunicorn workers each get their own)
+    def _executor(self):
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is None or self._pool_pid != pid:
+                # fork where available: spawn/forkserver re-run the __main__
+                # script (app.py under `python app.py`) in every worker. The
+                # workers only call invoice_render, so inherited threads are inert.
+                methods = multiprocessing.get_all_start_methods()
+                ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+                self._pool_pid = pid
+            return self._pool
+
+    def _bump(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _dispatch(self, job_id, payload, invoice_no, now):
+        t0 = time.perf_counter()
+        for attempt in range(2):
+            pool = self._executor()
+            try:
+                fut = pool.submit(_render_to_store, payload, invoice_no, now, self.root)
+                break
+            except BrokenProcessPool:
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                        self.stats["pool_restarts"] += 1
+                if attempt:
+                    raise
+        fut.add_done_callback(lambda f: self._finish(job_id, f, t0))
+
+    def _finish(self, job_id, fut, t0):
+        # runs on the executor's management thread; sqlite_pool gives it its own connection
+        db = self._get_conn()
+        render_s = None
+        try:
+            digest, size, render_s = fut.result()
+        except Exception as e:
+            db.execute(
+                "UPDATE invoices SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                (str(e) or e.__class__.__name__, time.time(), job_id),
+            )
+            self._bump("failed")
+            print(f"[invoices] {job_id} failed: {e!r}")
+        else:
+            db.execute(
+                "UPDATE invoices SET status = 'done', sha256 = ?, size = ?, updated_at = ? WHERE id = ?",
+                (digest, size, time.time(), job_id),
+            )
+            self._bump("done")
+        db.commit()
+        if self.observe is not None:
+            self.observe("failed" if render_s is None else "done", render_s, time.perf_counter() - t0)
+
+    def submit(self, payload):
+        """Record and queue a job; returns its public fields. Raises ValueError."""
+        validate_invoice(payload)
+        db = self._get_conn()
+        ts = time.time()
+        now = datetime.fromtimestamp(ts)
+        job_id = uuid.uuid4().hex
+        cur = db.execute(
+            "INSERT INTO invoices (id, status, payload, created_at, updated_at, owner) "
+            "VALUES (?, 'pending', ?, ?, ?, ?)",
+            (job_id, json.dumps(payload, ensure_ascii=False), ts, ts, os.getpid()),
+        )
+        invoice_no = f"INV{now:%Y%m%d}-{cur.lastrowid:06d}"
+        db.execute("UPDATE invoices SET invoice_no = ? WHERE seq = ?", (invoice_no, cur.lastrowid))
+        db.commit()
+        self._bump("submitted")
+        try:
+            self._dispatch(job_id, payload, invoice_no, now)
+        except Exception as e:
+            db.execute(
+                "UPDATE invoices SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                (f"could not queue: {e}", time.time(), job_id),
+            )
+            db.commit()
+            self._bump("failed")
+            return {"id": job_id, "invoice_no": invoice_no, "status": "failed"}
+        return {"id": job_id, "invoice_no": invoice_no, "status": "pending"}
+
+    def get(self, job_id):
+        """Job row (without payload) as a dict, or None. Requeues the job first if it was abandoned."""
+        db = self._get_conn()
+        row = db.execute(
+            "SELECT id, invoice_no, status, sha256, size, error, created_at, updated_at, owner "
+            "FROM invoices WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if self._abandoned(job):
+            self._requeue(job)
+        del job["owner"]
+        return job
+
+    def path_for(self, job):
+        return blob_path(self.root, job["sha256"])
+
+    def _abandoned(self, job):
+        """Pending, and its process has exited or it has been pending stale_after seconds."""
+        if job["status"] != "pending":
+            return False
+        if job["updated_at"] < time.time() - self.stale_after:
+            return True
+        return job["owner"] is not None and job["owner"] != os.getpid() and not _alive(job["owner"])
+
+    def _requeue(self, job):
+        """
+        Dispatch an abandoned job here. Bumping updated_at and owner claims
+        it, so only one process picks it up. Returns whether this one did.
+        """
+        db = self._get_conn()
+        cur = db.execute(
+            "UPDATE invoices SET updated_at = ?, owner = ? WHERE id = ? AND status = 'pending' AND updated_at = ?",
+            (time.time(), os.getpid(), job["id"], job["updated_at"]),
+        )
+        db.commit()
+        if cur.rowcount != 1:
+            return False
+        r = db.execute("SELECT payload FROM invoices WHERE id = ?", (job["id"],)).fetchone()
+        self._dispatch(job["id"], json.loads(r["payload"]), job["invoice_no"],
+                       datetime.fromtimestamp(job["created_at"]))
+        self._bump("recovered")
+        return True
+
+    def recover(self):
+        """Requeue every abandoned job (see _abandoned); returns how many this process took."""
+        rows = self._get_conn().execute(
+            "SELECT id, invoice_no, status, created_at, updated_at, owner FROM invoices WHERE status = 'pending'"
+        ).fetchall()
+        return sum(self._requeue(dict(r)) for r in rows if self._abandoned(dict(r)))
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+        rows = self._get_conn().execute("SELECT status, COUNT(*) AS n FROM invoices GROUP BY status").fetchall()
+        out["jobs"] = {r["status"]: r["n"] for r in rows}
+        out["max_workers"] = self.max_workers
+        out["store"] = self.root
+        return out
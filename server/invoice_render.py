@@ -0,0 +1,255 @@
+"""
+Invoice JSON -> PDF bytes, without Flask.
+
+Styles and table styles are built once at import; the header/footer page
+decorator is built once per business profile and cached. render_invoice()
+takes the same JSON the /api/invoices endpoint accepts, so it can run from
+a worker process or the command line:
+
+    python invoice_render.py job.json out.pdf
+"""
+import json
+import sys
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
+
+
+# ---------- helpers ----------
+def q2(val):  # 2-decimal, half-up like invoices
+    return Decimal(str(val)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def fmt_inr(x):
+    # keep it simple; ReportLab's base fonts may not render '₹' on all systems.
+    # If your '₹' renders fine already, change 'Rs.' to '₹'
+    return f"Rs. {q2(x)}"
+
+
+def _biz_from_payload(payload):
+    b = (payload or {}).get("business") or {}
+    # expected keys: store_name, store_address, store_gst, store_contact
+    return {
+        "store_name": b.get("store_name") or "My Shop",
+        "store_address": b.get("store_address") or "",
+        "store_gst": b.get("store_gst") or "",
+        "store_contact": b.get("store_contact") or "",
+    }
+
+
+# ---------- styles (built once) ----------
+# Plain Flate streams: skips a base85 pass per page and the PDF is ~20% smaller.
+rl_config.useA85 = 0
+
+BRAND = colors.HexColor("#0F766E")   # teal-700
+BAND_H = 22*mm
+MARGIN = 16*mm
+
+_styles = getSampleStyleSheet()
+H2 = ParagraphStyle('H2', parent=_styles['Heading2'],
+                    fontName='Helvetica-Bold', fontSize=12, leading=16, alignment=TA_LEFT)
+NORMAL = ParagraphStyle('NORMAL', parent=_styles['Normal'],
+                        fontName='Helvetica', fontSize=10, leading=14)
+RIGHT = ParagraphStyle('RIGHT', parent=_styles['Normal'],
+                       fontName='Helvetica', fontSize=10, leading=14, alignment=TA_RIGHT)
+
+META_STYLE = TableStyle([
+    ("VALIGN", (0,0), (-1,-1), "TOP"),
+    ("BOTTOMPADDING", (0,0), (-1,-1), 6),
+])
+ITEMS_STYLE = TableStyle([
+    ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+    ("FONTSIZE", (0,0), (-1,0), 10),
+    ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+    ("BACKGROUND", (0,0), (-1,0), BRAND),
+    ("ALIGN", (0,0), (0,-1), "CENTER"),
+    ("ALIGN", (2,1), (-1,-1), "RIGHT"),
+    ("ALIGN", (1,1), (1,-1), "LEFT"),
+    ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+    ("INNERGRID", (0,0), (-1,-1), 0.25, colors.lightgrey),
+    ("BOX", (0,0), (-1,-1), 0.5, colors.grey),
+    ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.whitesmoke, colors.Color(0.98,0.98,0.98)]),
+])
+TOTALS_STYLE = TableStyle([
+    ("FONTNAME", (0,0), (-1,-2), "Helvetica"),
+    ("FONTNAME", (0,-1), (-1,-1), "Helvetica-Bold"),
+    ("FONTSIZE", (0,0), (-1,-1), 11),
+    ("ALIGN", (0,0), (-1,-1), "RIGHT"),
+    ("BACKGROUND", (0,0), (-1,-1), colors.Color(0.99,0.99,1)),
+    ("BOX", (0,0), (-1,-1), 0.5, colors.HexColor("#A5B4FC")),
+    ("INNERGRID", (0,0), (-1,-1), 0.25, colors.Color(0.8,0.8,1)),
+    ("LEFTPADDING", (0,0), (-1,-1), 6),
+    ("RIGHTPADDING", (0,0), (-1,-1), 6),
+    ("TOPPADDING", (0,0), (-1,-1), 6),
+    ("BOTTOMPADDING", (0,0), (-1,-1), 6),
+])
+ITEMS_HEADER = ["#", "Description", "Price", "GST %", "GST Amt", "Line Total"]
+ITEMS_COLW = [10*mm, None, 26*mm, 18*mm, 26*mm, 30*mm]
+TOTALS_COLW = [40*mm, 35*mm]
+
+
+@lru_cache(maxsize=256)
+def page_decorator(store_name, store_address, store_gst, store_contact):
+    """Header band + footer for one business profile (cached per profile)."""
+    w, h = A4
+    line2 = []
+    if store_address: line2.append(store_address)
+    if store_gst: line2.append(f"GSTIN: {store_gst}")
+    if store_contact: line2.append(f"Contact: {store_contact}")
+    details = "  |  ".join(line2)
+    name_y = h - BAND_H + 7*mm
+    details_y = h - BAND_H - 6*mm
+
+    def draw_page(canvas, _doc):
+        canvas.saveState()
+        # Header band
+        canvas.setFillColor(BRAND)
+        canvas.rect(0, h - BAND_H, w, BAND_H, fill=1, stroke=0)
+        canvas.setFillColor(colors.white)
+        canvas.setFont("Helvetica-Bold", 16)
+        canvas.drawString(MARGIN, name_y, store_name)
+        # Header details under band
+        canvas.setFillColor(colors.black)
+        canvas.setFont("Helvetica", 9)
+        if details:
+            canvas.drawString(MARGIN, details_y, details)
+        # Footer
+        canvas.setFont("Helvetica", 9)
+        canvas.setFillColor(colors.grey)
+        canvas.drawRightString(w - MARGIN, 12*mm, f"Page {_doc.page}")
+        canvas.drawString(MARGIN, 12*mm, "Thank you for your business.")
+        canvas.restoreState()
+
+    return draw_page
+
+
+def _invoice_lines(data):
+    """Validate a payload and compute its rows and totals. Raises ValueError."""
+    data = data or {}
+    customer = ((data.get("customer") or {}).get("name") or "").strip()
+    items = data.get("items") or []
+
+    if not customer:
+        raise ValueError("Customer name required")
+    if not items:
+        raise ValueError("At least one item required")
+
+    rows = []
+    subtotal = Decimal("0"); gst_total = Decimal("0")
+    for i, it in enumerate(items, start=1):
+        desc = (it.get("description") or "").strip() or "-"
+        try:
+            price = Decimal(str(it.get("price") or 0))
+            gstp = Decimal(str(it.get("gstPercent") or 0))
+        except InvalidOperation:
+            price = gstp = Decimal("NaN")
+        if not (price.is_finite() and gstp.is_finite()):
+            raise ValueError(f"Invalid price or GST on item {i}")
+        gst_amt = (price * gstp / Decimal("100"))
+        line_total = price + gst_amt
+        subtotal += price; gst_total += gst_amt
+        rows.append([
+            str(i), desc, fmt_inr(price), f"{q2(gstp)}%", fmt_inr(gst_amt), fmt_inr(line_total)
+        ])
+    return customer, rows, subtotal, gst_total
+
+
+def validate_invoice(data):
+    """Raise ValueError if render_invoice() would reject this payload."""
+    _invoice_lines(data)
+
+
+def render_invoice(data, invoice_no=None, now=None):
+    """
+    Build the PDF for an invoice payload:
+      {"customer": {"name"}, "items": [{"description", "price", "gstPercent"}],
+       "paymentTerms": str, "business": {...}}
+    Returns (pdf_bytes, meta) where meta has invoice_no, date and totals.
+    Raises ValueError for an invalid payload.
+    """
+    data = data or {}
+    customer, rows, subtotal, gst_total = _invoice_lines(data)
+    grand = subtotal + gst_total
+    terms = (data.get("paymentTerms") or "").strip()
+    biz = _biz_from_payload(data)
+
+    # meta
+    now = now or datetime.now()
+    inv_date = now.strftime("%Y-%m-%d")
+    inv_no = invoice_no or now.strftime("INV%Y%m%d-%H%M%S")
+
+    buf = BytesIO()
+    doc = SimpleDocTemplate(
+        buf, pagesize=A4,
+        leftMargin=MARGIN, rightMargin=MARGIN,
+        topMargin=MARGIN, bottomMargin=MARGIN
+    )
+    draw_page = page_decorator(biz["store_name"], biz["store_address"], biz["store_gst"], biz["store_contact"])
+
+    story = [Spacer(1, BAND_H - 6*mm)]  # start content below header
+
+    # Meta table
+    meta_tbl = Table([
+        [
+            Paragraph("<b>Invoice</b>", H2),
+            Paragraph(f"<b>Invoice No:</b> {inv_no}<br/><b>Date:</b> {inv_date}", RIGHT)
+        ],
+        [
+            Paragraph(f"<b>Billed To</b><br/>{customer}", NORMAL),
+            ""
+        ]
+    ], colWidths=[None, 60*mm])
+    meta_tbl.setStyle(META_STYLE)
+    story.append(meta_tbl)
+    story.append(Spacer(1, 6*mm))
+
+    # Items
+    tbl = Table([ITEMS_HEADER] + rows, colWidths=ITEMS_COLW, hAlign="LEFT", repeatRows=1)
+    tbl.setStyle(ITEMS_STYLE)
+    story.append(tbl)
+    story.append(Spacer(1, 6*mm))
+
+    # Totals
+    totals = Table([
+        ["Subtotal", fmt_inr(subtotal)],
+        ["GST Total", fmt_inr(gst_total)],
+        ["Grand Total", fmt_inr(grand)],
+    ], colWidths=TOTALS_COLW, hAlign="RIGHT")
+    totals.setStyle(TOTALS_STYLE)
+    story.append(totals)
+
+    if terms:
+        story.append(Spacer(1, 8*mm))
+        story.append(Paragraph("<b>Payment Terms</b>", H2))
+        story.append(Spacer(1, 1*mm))
+        story.append(Paragraph(terms, NORMAL))
+
+    doc.build(story, onFirstPage=draw_page, onLaterPages=draw_page)
+    meta = {
+        "invoice_no": inv_no,
+        "date": inv_date,
+        "customer": customer,
+        "subtotal": str(q2(subtotal)),
+        "gst_total": str(q2(gst_total)),
+        "grand_total": str(q2(grand)),
+    }
+    return buf.getvalue(), meta
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python invoice_render.py job.json out.pdf")
+    with open(sys.argv[1], encoding="utf-8") as f:
+        pdf, info = render_invoice(json.load(f))
+    with open(sys.argv[2], "wb") as f:
+        f.write(pdf)
+    print(json.dumps(info))
@@ -0,0 +1,237 @@
+"""
+Concurrent LLM backend.
+
+Completions run on one asyncio loop in a background thread, so many can be
+outstanding at once (capped by a semaphore) while Flask workers only wait on
+a future with a hard deadline. Each call gets jittered retries inside its
+deadline, and a circuit breaker stops sending traffic to a failing endpoint
+for a cooldown period; callers then fall back to the local parser.
+"""
+import asyncio
+import concurrent.futures
+import random
+import threading
+import time
+
+import openai
+from openai import AsyncOpenAI
+
+# Worth another attempt; anything else (bad request, auth) fails immediately.
+RETRYABLE = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+class LLMUnavailable(Exception):
+    """No answer within the deadline/retry budget, or the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive failures; open rejects calls
+    for `cooldown` seconds, then lets a single trial through (half-open).
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class LLMBackend:
+    def __init__(self, api_key=None, base_url=None, model="gpt-4o-mini",
+                 max_concurrency=16, deadline=12.0, attempt_timeout=6.0,
+                 max_attempts=3, backoff=0.25, breaker=None, observe=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        # observe(outcome, seconds, usage) after every attempt, on the loop thread;
+        # outcome is ok | error | timeout, usage the response's token counts or None
+        self.observe = observe
+        self._loop = None
+        self._client = None
+        self._sem = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0,
+                      "rejected_open": 0, "in_flight": 0, "max_in_flight": 0}
+
+    # -- loop management (started lazily so forked workers each get their own)
+    def _ensure_loop(self):
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                try:
+                    self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+                except openai.OpenAIError as e:
+                    # e.g. no OPENAI_API_KEY: callers take their no-LLM fallbacks
+                    raise LLMUnavailable("LLM not configured") from e
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+
+                async def make_semaphore():
+                    return asyncio.Semaphore(self.max_concurrency)
+
+                self._sem = asyncio.run_coroutine_threadsafe(make_semaphore(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    def _bump(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+            if key == "in_flight":
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    async def _attempt(self, messages, max_tokens, timeout):
+        async with self._sem:
+            self._bump("attempts")
+            self._bump("in_flight")
+            t0 = time.perf_counter()
+            outcome, resp = "error", None
+            try:
+                resp = await self._client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0,
+                    max_tokens=max_tokens,
+                    timeout=timeout,
+                )
+                outcome = "ok"
+                return resp
+            except (asyncio.CancelledError, asyncio.TimeoutError, openai.APITimeoutError):
+                outcome = "timeout"
+                raise
+            finally:
+                self._bump("in_flight", -1)
+                if self.observe is not None:
+                    self.observe(outcome, time.perf_counter() - t0, getattr(resp, "usage", None))
+
+    async def acomplete(self, messages, max_tokens=300, deadline=None):
+        """Content of the first choice. Raises LLMUnavailable."""
+        if not self.breaker.allow():
+            self._bump("rejected_open")
+            raise LLMUnavailable("circuit open")
+        self._bump("calls")
+        budget_end = time.monotonic() + (deadline or self.deadline)
+        last_exc = None
+        for attempt in range(self.max_attempts):
+            remaining = budget_end - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = min(self.attempt_timeout, remaining)
+            try:
+                # queueing for the semaphore counts against the attempt too
+                resp = await asyncio.wait_for(self._attempt(messages, max_tokens, timeout), timeout)
+                self.breaker.record_success()
+                return resp.choices[0].message.content if resp.choices else None
+            except RETRYABLE as e:
+                last_exc = e
+                # full jitter, never sleeping past the deadline
+                pause = random.uniform(0, self.backoff * (2 ** attempt))
+                if attempt + 1 < self.max_attempts and time.monotonic() + pause < budget_end:
+                    self._bump("retries")
+                    await asyncio.sleep(pause)
+                    continue
+                break
+            except openai.APIStatusError as e:
+                self.breaker.record_success()  # the endpoint is up; the request is bad
+                raise LLMUnavailable(str(e)) from e
+            except asyncio.CancelledError:
+                # complete()'s grace ran out: settle the breaker (a half-open trial included)
+                self.breaker.record_failure()
+                raise
+            except Exception as e:
+                # a malformed response or an unexpected transport error: not worth a retry
+                self._bump("failures")
+                self.breaker.record_failure()
+                raise LLMUnavailable(f"LLM call failed: {e!r}") from e
+        self._bump("failures")
+        self.breaker.record_failure()
+        raise LLMUnavailable(f"LLM call failed: {last_exc or 'deadline exceeded'}") from last_exc
+
+    def complete(self, messages, max_tokens=300, deadline=None):
+        """Blocking wrapper for request handlers. Raises LLMUnavailable."""
+        loop = self._ensure_loop()
+        fut = asyncio.run_coroutine_threadsafe(self.acomplete(messages, max_tokens, deadline), loop)
+        try:
+            # small grace so the coroutine's own deadline fires first
+            return fut.result(timeout=(deadline or self.deadline) + 1.0)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            raise LLMUnavailable("deadline exceeded")
+
+    def complete_many(self, calls, deadline=None):
+        """
+        calls: [(messages, max_tokens)]. Runs them concurrently on the loop and
+        returns a list of content strings or LLMUnavailable, in order.
+        """
+        try:
+            loop = self._ensure_loop()
+        except LLMUnavailable as e:
+            return [e] * len(calls)
+
+        async def gather():
+            return await asyncio.gather(
+                *(self.acomplete(m, t, deadline) for m, t in calls), return_exceptions=True
+            )
+
+        fut = asyncio.run_coroutine_threadsafe(gather(), loop)
+        try:
+            results = fut.result(timeout=(deadline or self.deadline) + 1.0)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            return [LLMUnavailable("deadline exceeded")] * len(calls)
+        return [r if not isinstance(r, BaseException) or isinstance(r, LLMUnavailable)
+                else LLMUnavailable(str(r)) for r in results]
+
+    def snapshot(self):
+        with self._stats_lock:
+            out = dict(self.stats)
+        out["breaker"] = self.breaker.state
+        out["max_concurrency"] = self.max_concurrency
+        return out
@@ -0,0 +1,339 @@
+"""
+Chat message -> ledger items.
+
+Two paths: a local rule-based parser for the common shapes spelled out in
+SYSTEM_PROMPT (sales, units, expenses, names, repayments), and the LLM for
+everything else. fast_parse() returns None, or a result with a confidence,
+and the caller falls back to the model when confidence is low.
+"""
+import json
+import re
+import unicodedata
+from collections import namedtuple
+
+LLM_MODEL = "gpt-4o-mini"
+
+SYSTEM_PROMPT = """You are a strict JSON parser. Return ONLY a JSON object with an 'items' array.
+                    Each item must have: product (string|null), units (number), revenue (number), credit (boolean), creditor (string|null).
+
+                    SALES RULES:
+                    • Parse sales like '1 kg garam masala 250 rs', '500 gm haldi masala 250 rs suresh', '1000 rs ramesh'.
+                    • If a PERSON NAME appears → CREDIT SALE (credit=true, creditor=name). If no name → CASH SALE (credit=false).
+                    • Price accepts '250', '250 rs', '₹250', etc.
+                    • IMPORTANT: If the input is ONLY a number (e.g. "1000", "-250") with no product/units:
+                        - product = null
+                        - units = 0
+                        - revenue = that number
+                        - credit = false
+                        - creditor = null
+
+                    UNITS RULES:
+                    • If user explicitly writes units (e.g. "2 colgate", "50 unit maggi pack") → use that number.
+                    • If user writes "pair" → units=2, "single" → units=1.
+                    • If user writes weights/sizes like "500 gm", "1 kg" → keep in product string, units=1.
+                    • Otherwise, if no explicit unit → units=0.
+
+                    EXPENSE RULES:
+                    • Expenses always have revenue NEGATIVE.
+                    • Example: '-1250 rs Dal vendor cash' → Expense paid immediately.
+                    • Example: '-1250 rs Dal vendor' (no 'cash') → Expense payable.
+                    • If vendor missing → product=null, credit=true, creditor=null.
+                    • Keywords like rent, electricity, expense → treat as expenses even if not prefixed with '-'.
+
+                    REPAYMENT RULES:
+                    • "Ramesh paid 1000" → customer repayment inflow, reduces receivable:
+                      { "product": null, "units": 0, "revenue": 1000, "credit": false, "creditor": "Ramesh" }
+                    • "Paid Dal Vendor 1250" → vendor repayment outflow, reduces payable:
+                      { "product": null, "units": 0, "revenue": -1250, "credit": false, "creditor": "Dal Vendor" }
+
+                    NAMES VS TOKENS:
+                    • Ignore tokens: rs, inr, rupee, ₹, unit, units, kg, gm, g, litre, liter, l, ml, pack, packs, packet, pair, single, of, cash, paid, to.
+                    • Names = alphabetic tokens not in the above list. Join multiple words at end as creditor.
+
+                    OUTPUT EXACTLY:
+                    { "items": [ { "product": string|null, "units": number, "revenue": number, "credit": boolean, "creditor": string|null } ] }
+                    """
+
+# Below this the fast path defers to the LLM.
+FASTPATH_MIN_CONFIDENCE = 0.8
+
+FastParse = namedtuple("FastParse", "items confidence rule")
+
+CURRENCY = {"rs", "rs.", "inr", "rupee", "rupees", "₹", "रु", "रुपये"}
+SIZE_UNITS = {"kg", "kgs", "gm", "gms", "g", "gram", "grams", "l", "ltr", "litre", "liter", "ml"}
+COUNT_WORDS = {"unit", "units", "pc", "pcs", "piece", "pieces", "pack", "packs", "packet", "packets"}
+PAIR_WORDS = {"pair": 2, "single": 1}
+CASH_WORDS = {"cash", "paid", "नकद"}
+EXPENSE_WORDS = {"rent", "electricity", "expense", "expenses"}
+# Never part of a person / vendor name.
+CONNECTORS = {"of", "to", "credit", "udhar", "cash", "paid", "payable", "नकद", "उधार"}
+# Sentence-like phrasing ("ramesh ko 500 ka saman diya", "sold ... for 90") is left to the model.
+PROSE_WORDS = {"ko", "ka", "ki", "ke", "ne", "se", "diya", "liya", "diye", "liye",
+               "sold", "bought", "gave", "for", "from", "yesterday", "today"}
+
+_TOKEN_RE = re.compile(r"₹|-?\d+(?:\.\d+)?|[^\s\d₹]+")
+_MULTI_ITEM_RE = re.compile(r"[\n;+]|,(?!\d)|\band\b", re.IGNORECASE)
+_DIGIT_COMMA_RE = re.compile(r"(?<=\d),(?=\d)")
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _is_word(tok):
+    # isalpha() alone rejects Devanagari names: vowel signs are combining marks.
+    return all(ch.isalpha() or unicodedata.category(ch).startswith("M") for ch in tok)
+
+
+def _is_number(tok):
+    return _NUMBER_RE.fullmatch(tok) is not None
+
+
+def _item(product, units, revenue, credit, creditor):
+    return {
+        "product": product,
+        "units": units,
+        "revenue": float(revenue),
+        "credit": credit,
+        "creditor": creditor,
+    }
+
+
+def _name(words):
+    return " ".join(words).title() if words else None
+
+
+def _repayment(tokens):
+    # Customer repayment: "Ramesh paid 1000"
+    if len(tokens) >= 3 and tokens[1] == "paid" and tokens[-1].isdigit():
+        return FastParse([{
+            "product": "Repayment",
+            "units": 0,
+            "revenue": float(tokens[-1]),   # subtracts from receivable
+            "credit": False,
+            "creditor": tokens[0].capitalize(),
+        }], 1.0, "repayment_customer")
+    # Vendor repayment: "Paid Dal Vendor 1250"
+    if tokens[0] == "paid" and tokens[-1].isdigit():
+        return FastParse([{
+            "product": "Repayment",
+            "units": 0,
+            "revenue": +float(tokens[-1]),  # subtracts from payable
+            "credit": True,
+            "creditor": " ".join(tokens[1:-1]).title(),
+        }], 1.0, "repayment_vendor")
+    return None
+
+
+def fast_parse(message):
+    """
+    Parse a single-entry message without the LLM.
+
+    Returns FastParse(items, confidence, rule) or None when the message is
+    outside the grammar (no amount, several items, conflicting prices).
+    """
+    text = (message or "").strip()
+    if not text:
+        return None
+    rep = _repayment(text.lower().split())
+    if rep:
+        return rep
+
+    text = _DIGIT_COMMA_RE.sub("", text)
+    if _MULTI_ITEM_RE.search(text):
+        return None
+
+    toks = _TOKEN_RE.findall(text)
+    low = [t.lower() for t in toks]
+    n = len(toks)
+    confidence = 1.0
+
+    # A lone "-" in front of the first number is a sign ("- 250 electricity").
+    negative = False
+    if n >= 2 and low[0] == "-" and _is_number(toks[1]):
+        negative = True
+        toks, low, n = toks[1:], low[1:], n - 1
+
+    nums = [i for i, t in enumerate(toks) if _is_number(t)]
+    if not nums:
+        return None
+
+    skip = set()          # indices that are neither product nor name text
+    size_idx = set()
+    count = None
+    marked, bare = [], []
+    for i in nums:
+        nxt = low[i + 1] if i + 1 < n else None
+        prv = low[i - 1] if i > 0 else None
+        if nxt in SIZE_UNITS:
+            size_idx.add(i)
+        elif prv == "of":
+            continue  # "pack of 2" stays in the product name
+        elif nxt in CURRENCY or prv in CURRENCY:
+            marked.append(i)
+        elif i == 0 and len(nums) > 1 and nxt is not None:
+            count = int(float(toks[i]))
+            skip.add(i)
+            if nxt in COUNT_WORDS:
+                skip.add(i + 1)
+        else:
+            bare.append(i)
+
+    if len(marked) > 1:
+        return None
+    if marked:
+        price_idx = marked[0]
+        confidence -= 0.4 * len(bare)
+    elif bare:
+        price_idx = bare[-1]
+        confidence -= 0.4 * (len(bare) - 1)
+    else:
+        return None
+
+    amount = float(toks[price_idx])
+    if amount < 0:
+        negative = True
+    amount = abs(amount)
+    skip.add(price_idx)
+    skip.update(i for i, t in enumerate(low) if t in CURRENCY)
+
+    before = [i for i in range(price_idx) if i not in skip]
+    after = [i for i in range(price_idx + 1, n) if i not in skip]
+    words = {low[i] for i in before + after}
+    if words & PROSE_WORDS:
+        confidence -= 0.5
+
+    # Only an amount ("1000", "-250", "₹ 500")
+    if not before and not after:
+        revenue = -amount if negative else amount
+        return FastParse([_item(None, 0, revenue, False, None)], confidence, "amount_only")
+
+    if negative or words & EXPENSE_WORDS:
+        return _expense(toks, low, before, after, amount, confidence)
+
+    # ---- sale ----
+    name_idx = [i for i in after if low[i] not in CONNECTORS]
+    if any(not _is_word(toks[i]) for i in name_idx):
+        confidence -= 0.5
+    if len(name_idx) > 3:
+        confidence -= 0.3
+    if "paid" in words or "payable" in words:
+        confidence -= 0.5
+
+    units = count
+    for i in before:
+        if low[i] in PAIR_WORDS:
+            units = units or PAIR_WORDS[low[i]]
+            skip.add(i)
+    product_idx = [i for i in before if i not in skip]
+    if units is None:
+        units = 1 if size_idx else 0
+    product = " ".join(toks[i] for i in product_idx) or None
+    if product is None:
+        units = 0
+    creditor = _name([toks[i] for i in name_idx])
+    return FastParse([_item(product, units, amount, bool(creditor), creditor)], max(confidence, 0.0), "sale")
+
+
+def _expense(toks, low, before, after, amount, confidence):
+    region = before + after
+    if any(not _is_word(toks[i]) for i in region if low[i] not in CURRENCY):
+        confidence -= 0.5
+    paid_now = any(low[i] in CASH_WORDS for i in region)
+    if "to" in [low[i] for i in region]:
+        cut = [low[i] for i in region].index("to")
+        head = [toks[i] for i in region[:cut] if low[i] not in CONNECTORS]
+        party = [toks[i] for i in region[cut + 1:] if low[i] not in CONNECTORS]
+    else:
+        head = party = [toks[i] for i in region if low[i] not in CONNECTORS]
+
+    product = None
+    if head or party:
+        product = f"Expense: {_name(head or party)}" + (" paid" if "paid" in {low[i] for i in region} else "")
+    if paid_now:
+        item = _item(product, 0, -amount, False, None)
+    else:
+        item = _item(product, 0, -amount, True, _name(party))
+    return FastParse([item], max(confidence, 0.0), "expense")
+
+
+def extract_json(content):
+    """The JSON object in an LLM reply (tolerates prose around it), or None; never a bare array or scalar."""
+    try:
+        obj = json.loads(content)
+    except Exception:
+        obj = None
+    if isinstance(obj, dict):
+        return obj
+    m = re.search(r"\{[\s\S]*\}", content or "")
+    if not m:
+        return None
+    try:
+        obj = json.loads(m.group(0))
+    except Exception:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def normalize_items(items):
+    norm = []
+    for it in items:
+        product = (it.get("product") or None)
+        try:
+            units = int(float(it.get("units", 0)))
+        except Exception:
+            units = 0
+        try:
+            revenue = float(it.get("revenue", 0))
+        except Exception:
+            revenue = 0.0
+        credit = bool(it.get("credit", False))
+        creditor = it.get("creditor") or None
+
+        norm.append({
+            "product": product,
+            "units": units,
+            "revenue": revenue,
+            "credit": credit,
+            "creditor": creditor
+        })
+    return norm
+
+
+# ---------- Batch (many lines, one completion) ----------
+BATCH_INSTRUCTIONS = """
+                    BATCH MODE:
+                    • The user message contains several independent entries, one per line, each prefixed with its index like "3: ...".
+                    • Parse each line on its own using the rules above.
+                    • Return ONLY: { "results": [ { "index": number, "items": [ ...items as above... ] } ] } with one result per input line.
+                    """
+
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + BATCH_INSTRUCTIONS
+
+
+def batch_user_message(lines):
+    """lines: [(index, text)] -> the numbered block sent as the user turn."""
+    return "\n".join(f"{i}: {' '.join(text.split())}" for i, text in lines)
+
+
+def split_batch_response(obj, indices):
+    """
+    {"results": [{"index", "items"}]} -> {index: normalized items} for the
+    indices we asked about. Missing or malformed results are left out.
+    """
+    wanted = set(indices)
+    out = {}
+    if not isinstance(obj, dict):
+        return out
+    results = obj.get("results")
+    if not isinstance(results, list):
+        return out
+    for r in results:
+        if not isinstance(r, dict):
+            continue
+        try:
+            idx = int(r.get("index"))
+        except (TypeError, ValueError):
+            continue
+        items = r.get("items")
+        # one non-object item and the line is "missing": better than half of it
+        if idx in wanted and isinstance(items, list) and all(isinstance(it, dict) for it in items):
+            out[idx] = normalize_items(items)
+    return out
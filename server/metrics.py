@@ -0,0 +1,225 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters and histograms are plain dicts behind a lock, keyed by label
+values; callback metrics read existing stats (LLM backend, invoice queue)
+at scrape time. render() produces the /metrics body.
+
+Values are per process: under gunicorn each worker keeps its own, so
+scrape workers individually (or sum across them) rather than through a
+load balancer.
+
+Per-request profiles: while a request carries one (see start_profile),
+SQL statements and timed spans made on its thread add to it, and the
+totals come back as a Server-Timing header.
+"""
+import contextvars
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, n=1, **labels):
+        key = tuple(labels.get(k, "") for k in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _labels(self.labelnames, k), v) for k, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(k, "") for k in self.labelnames)
+        i = bisect_left(self.buckets, value)  # first bucket with le >= value
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            row[i] += 1
+            row[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        out = []
+        for key, row in items:
+            running = 0
+            for le, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                running += n
+                out.append((self.name + "_bucket", _labels(self.labelnames, key, f'le="{_num(le)}"'), running))
+            out.append((self.name + "_sum", _labels(self.labelnames, key), row[-1]))
+            out.append((self.name + "_count", _labels(self.labelnames, key), running))
+        return out
+
+
+class Callback:
+    """A gauge (or counter) read at scrape time: fn() -> number or {label values: number}."""
+
+    def __init__(self, name, help, fn, labelnames=(), kind="gauge"):
+        self.name, self.help, self.fn, self.labelnames, self.kind = name, help, fn, tuple(labelnames), kind
+        _metrics.append(self)
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if not isinstance(value, dict):
+            return [(self.name, "", value)]
+        return [(self.name, _labels(self.labelnames, k if isinstance(k, tuple) else (k,)), v)
+                for k, v in value.items()]
+
+
+def render():
+    lines = []
+    for m in _metrics:
+        samples = m.samples()
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        for name, labels, value in samples:
+            lines.append(f"{name}{labels} {_num(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- SQL ----------
+SQL_SECONDS = Histogram("ledger_sql_seconds", "SQLite statement time by statement shape",
+                        ("statement",), SQL_BUCKETS)
+
+_WS = re.compile(r"\s+")
+_STR = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+@lru_cache(maxsize=2048)
+def sql_shape(sql):
+    """Statement with literals and placeholder lists folded, so label values stay few."""
+    s = _WS.sub(" ", sql).strip()
+    s = _STR.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    s = _PLACEHOLDERS.sub("?, ...", s)
+    return s[:160]
+
+
+def observe_sql(sql, seconds):
+    shape = sql_shape(sql)
+    SQL_SECONDS.observe(seconds, statement=shape)
+    prof = _profile.get()
+    if prof is not None:
+        prof["sql_n"] += 1
+        prof["sql_s"] += seconds
+        by = prof["sql"]
+        n, s = by.get(shape, (0, 0.0))
+        by[shape] = (n + 1, s + seconds)
+
+
+# ---------- Per-request profiles ----------
+_profile = contextvars.ContextVar("ledger_profile", default=None)
+
+
+def start_profile():
+    """Begin collecting for the current request (thread/context); returns a token for end_profile."""
+    return _profile.set({"t0": time.perf_counter(), "sql_n": 0, "sql_s": 0.0, "sql": {}, "spans": {}})
+
+
+def end_profile(token):
+    prof = _profile.get()
+    _profile.reset(token)
+    return prof
+
+
+@contextmanager
+def span(name):
+    """Time a block into the current request's profile (no-op without one)."""
+    prof = _profile.get()
+    if prof is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        n, s = prof["spans"].get(name, (0, 0.0))
+        prof["spans"][name] = (n + 1, s + time.perf_counter() - t0)
+
+
+def server_timing(prof, top=3):
+    """Server-Timing header value for a finished profile."""
+    total = (time.perf_counter() - prof["t0"]) * 1000
+    parts = [f"total;dur={total:.2f}", f'sql;dur={prof["sql_s"] * 1000:.2f};desc="{prof["sql_n"]} statements"']
+    for name, (n, s) in prof["spans"].items():
+        parts.append(f'{name};dur={s * 1000:.2f};desc="{n} calls"')
+    slowest = sorted(prof["sql"].items(), key=lambda kv: -kv[1][1])[:top]
+    for i, (shape, (n, s)) in enumerate(slowest, start=1):
+        desc = shape[:80].replace('"', "'").replace("\\", "/")
+        parts.append(f'sql{i};dur={s * 1000:.2f};desc="{n}x {desc}"')
+    return ", ".join(parts)
+
+
+# ---------- Slow requests ----------
+class SlowLog:
+    """The last `size` requests slower than `threshold` seconds, with who made them."""
+
+    def __init__(self, threshold=0.5, size=200):
+        self.threshold = threshold
+        self._items = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds, **info):
+        if seconds < self.threshold:
+            return False
+        with self._lock:
+            self._items.append({"seconds": round(seconds, 4), "at": time.time(), **info})
+        return True
+
+    def snapshot(self):
+        with self._lock:
+            items = list(self._items)
+        return sorted(items, key=lambda r: -r["seconds"])
@@ -0,0 +1,130 @@
+"""
+Fuzzy lookup over one shop's counterparty names.
+
+name_key() already folds case, width and spacing, so "ramesh sharma " is
+"Ramesh Sharma". What it leaves apart are spellings: "Ramesh Sharmaa",
+"Sharma Ramesh", "RameshSharma". Two lookups cover them:
+
+  canonical()  the write and parse paths. Conservative: a new spelling is
+               mapped onto an existing name only if they agree once typos
+               are folded away (word order, spaces and punctuation,
+               doubled letters, one swapped pair of letters), digits
+               included, and exactly one existing name does. A general
+               "one edit apart" rule would merge Sita and Smita.
+  match()      the lookup endpoint. Ranked suggestions by trigram Dice
+               similarity. Candidates come out of the posting lists of the
+               query's rarest trigrams first (collections.Counter counts
+               them in C) until POSTINGS_BUDGET slots have been read, and
+               only the best few are scored exactly, so a lookup over
+               thousands of names stays well under a millisecond.
+"""
+import re
+from collections import Counter
+
+from names import name_key
+
+_WORD = re.compile(r"[^\W_]+")
+_REPEATS = re.compile(r"([^\W\d_])\1+")
+MIN_SWAP_LEN = 6  # shorter names differ by a swap too often to call it a typo
+POSTINGS_BUDGET = 400
+MIN_LISTS = 3
+
+
+def trigrams(key):
+    s = f"  {key} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def _words(key):
+    return "".join(sorted(_WORD.findall(key)))
+
+
+def fold(key):
+    """A name key with word order, separators and doubled letters folded away."""
+    return _REPEATS.sub(r"\1", _words(key))
+
+
+def _one_swap(a, b):
+    """b is a with one pair of adjacent letters exchanged ("12" and "21" are different customers)."""
+    if len(a) != len(b) or a == b:
+        return False
+    diff = [i for i in range(len(a)) if a[i] != b[i]]
+    return (len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+            and a[diff[0]].isalpha() and a[diff[1]].isalpha())
+
+
+class NameIndex:
+    """Not locked: callers serialize add(); lookups may run alongside it."""
+
+    def __init__(self):
+        self.names = {}      # key -> (id, display name)
+        self.max_id = 0      # highest counterparties.id added
+        self._keys = []      # slot -> key
+        self._grams = []     # slot -> trigram set
+        self._postings = {}  # trigram -> [slot]
+        self._folded = {}    # fold(key) -> key, first seen wins
+        self._letters = {}   # sorted letters of _words(key) -> [key], for swapped-letter typos
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, cid, key, name):
+        self.max_id = max(self.max_id, cid)
+        if not key or key in self.names:
+            return
+        grams = trigrams(key)
+        slot = len(self._keys)
+        # the slot's data before its postings: a concurrent _candidates() may read any slot it finds
+        self._grams.append(grams)
+        self._keys.append(key)
+        for g in grams:
+            self._postings.setdefault(g, []).append(slot)
+        self._folded.setdefault(fold(key), key)
+        self._letters.setdefault("".join(sorted(_words(key))), []).append(key)
+        self.names[key] = (cid, name)
+
+    def _candidates(self, key, limit):
+        """[(dice, key)] best first, over names sharing any trigram with key."""
+        grams = trigrams(key)
+        lists = sorted((self._postings[g] for g in grams if g in self._postings), key=len)
+        shared, read = Counter(), 0
+        for i, slots in enumerate(lists):
+            # common trigrams (" ra", "sha") add volume, not discrimination; but
+            # always read a few so a query made of common ones still finds something
+            if read + len(slots) > POSTINGS_BUDGET and i >= MIN_LISTS:
+                break
+            shared.update(slots)
+            read += len(slots)
+        # a few times more than asked by partial overlap, then rank by exact Dice
+        scored = [(2 * len(grams & self._grams[slot]) / (len(grams) + len(self._grams[slot])), self._keys[slot])
+                  for slot, _k in shared.most_common(limit * 4)]
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return scored[:limit]
+
+    def match(self, query, limit=5, min_score=0.3):
+        """[(score, key)] for names like query, best first; an exact or folded match scores 1."""
+        key = name_key(query)
+        if not key:
+            return []
+        same = self.canonical(key)
+        out = [(1.0, same)] if same else []
+        out += [(round(s, 3), k) for s, k in self._candidates(key, limit + 1) if s >= min_score and k != same]
+        return out[:limit]
+
+    def canonical(self, query):
+        """Key of the existing name query is a typo of (or is), else None."""
+        key = name_key(query)
+        if not key:
+            return None
+        if key in self.names:
+            return key
+        folded = fold(key)
+        hit = self._folded.get(folded)
+        if hit is not None:
+            return hit
+        # before doubled letters fold: "Ramehs Sharma" swaps into a double "ss"
+        words = _words(key)
+        if len(words) < MIN_SWAP_LEN:
+            return None
+        swaps = {k for k in self._letters.get("".join(sorted(words)), ()) if _one_swap(words, _words(k))}
+        return swaps.pop() if len(swaps) == 1 else None
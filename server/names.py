@@ -0,0 +1,21 @@
+"""
+Name folding for products and counterparties.
+
+"Surf Excel  Matic", "surf excel matic" and "ＳＵＲＦ excel matic" are the
+same product to a shopkeeper. name_key() is the form used for lookups and
+uniqueness in the products/counterparties tables; display_name() is what
+gets stored for showing back.
+"""
+import unicodedata
+from functools import lru_cache
+
+
+@lru_cache(maxsize=65536)
+def name_key(name):
+    """NFKC, casefolded, whitespace collapsed. '' for blank names."""
+    s = unicodedata.normalize("NFKC", name or "").casefold()
+    return " ".join(s.split())
+
+
+def display_name(name):
+    return " ".join((name or "").split())
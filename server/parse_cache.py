@@ -0,0 +1,134 @@
+"""
+Two-tier cache for LLM parse results.
+
+temperature=0 makes the model's answer a function of (message, model, prompt),
+so repeated messages ("1000 rs ramesh", "maggi 14 rs") can skip the round trip.
+Tier 1 is an in-process LRU; tier 2 is the parse_cache table, shared by all
+workers and surviving restarts. The prompt's hash is part of the key, so
+editing SYSTEM_PROMPT invalidates old entries without a manual flush.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_WS_RE = re.compile(r"\s+")
+_DIGIT_COMMA_RE = re.compile(r"(?<=\d),(?=\d)")
+
+
+def prompt_version(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_message(message):
+    """Case/whitespace/width-insensitive form used for cache keys."""
+    s = unicodedata.normalize("NFKC", message or "").casefold()
+    s = _DIGIT_COMMA_RE.sub("", s)
+    return _WS_RE.sub(" ", s).strip()
+
+
+class ParseCache:
+    def __init__(self, get_conn, model, prompt, max_memory=4096, max_rows=100_000):
+        self._get_conn = get_conn
+        self.model = model
+        self.version = prompt_version(prompt)
+        self.max_memory = max_memory
+        self.max_rows = max_rows
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._rows = None  # lazily counted, then tracked
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def key(self, message):
+        raw = f"{self.model}\x1f{self.version}\x1f{normalize_message(message)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, items):
+        with self._lock:
+            self._lru[key] = items
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_memory:
+                self._lru.popitem(last=False)
+
+    def get(self, message):
+        """Cached items for message, or None."""
+        key = self.key(message)
+        with self._lock:
+            items = self._lru.get(key)
+            if items is not None:
+                self._lru.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return items
+
+        db = self._get_conn()
+        row = db.execute("SELECT response FROM parse_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        db.execute("UPDATE parse_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        db.commit()
+        items = json.loads(row["response"])
+        self._remember(key, items)
+        with self._lock:
+            self.stats["db_hits"] += 1
+        return items
+
+    def put(self, message, items):
+        key = self.key(message)
+        self._remember(key, items)
+        db = self._get_conn()
+        cur = db.execute(
+            "INSERT OR REPLACE INTO parse_cache (key, model, prompt_version, message, response, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, self.model, self.version, normalize_message(message),
+             json.dumps(items, ensure_ascii=False), time.time()),
+        )
+        db.commit()
+        with self._lock:
+            self.stats["stores"] += 1
+            if self._rows is None:
+                self._rows = db.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+            else:
+                self._rows += cur.rowcount
+            over = self._rows > self.max_rows
+        if over:
+            self._evict(db)
+
+    def _evict(self, db):
+        """Drop the least recently used 10% so eviction runs rarely."""
+        n = max(1, self.max_rows // 10)
+        cur = db.execute(
+            "DELETE FROM parse_cache WHERE key IN "
+            "(SELECT key FROM parse_cache ORDER BY last_used LIMIT ?)",
+            (n,),
+        )
+        db.commit()
+        with self._lock:
+            self._rows = db.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+            self.stats["evictions"] += cur.rowcount
+
+    def purge_stale(self):
+        """Delete rows written under another model or prompt version."""
+        db = self._get_conn()
+        cur = db.execute(
+            "DELETE FROM parse_cache WHERE model != ? OR prompt_version != ?",
+            (self.model, self.version),
+        )
+        db.commit()
+        self._rows = None
+        return cur.rowcount
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["memory_size"] = len(self._lru)
+        out["db_size"] = self._get_conn().execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+        lookups = out["memory_hits"] + out["db_hits"] + out["misses"]
+        out["hit_rate"] = round((out["memory_hits"] + out["db_hits"]) / lookups, 4) if lookups else None
+        out["model"] = self.model
+        out["prompt_version"] = self.version
+        return out
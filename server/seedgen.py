@@ -0,0 +1,201 @@
+"""
+Synthetic shop ledgers for demos and load tests.
+
+gen_product_catalog / gen_vendors / gen_customer_pool build the populations
+behind the August demo seed (app.realistic_august_seed) and draw from the
+global random, so that seed stays the same. shop_rows() is the bulk
+version: any number of shops over any run of months, each drawn from its
+own random.Random so a shop's rows depend only on (seed, mobile).
+
+    rows = shop_rows("9000000001", date(2025, 1, 1), months=12, seed=7)
+"""
+import random
+from datetime import date
+from functools import lru_cache
+
+def _build_catalog(rng):
+    bases = [
+        "Colgate", "Close-Up", "Pepsodent", "Sensodyne", "Dabur Red", "Oral-B",
+        "Surf Excel", "Ariel", "Tide", "Rin", "Nirma", "Wheel",
+        "Maggi", "Yippee", "Top Ramen",
+        "Dettol Soap", "Lifebuoy Soap", "Pears Soap", "Lux Soap", "Dove Soap",
+        "Dettol Liquid", "Savlon Handwash", "Lifebuoy Handwash",
+        "Lizol", "Harpic", "Domex",
+        "Good Knight Refill", "All-Out Refill", "Mortein Coil",
+        "Clinic Plus Shampoo", "Sunsilk Shampoo", "Pantene Shampoo", "Head & Shoulders",
+        "Bru Coffee", "Nescafe", "Tata Tea", "Red Label Tea",
+        "Basmati Rice", "Wheat Flour", "Sugar", "Salt", "Cooking Oil",
+        "Kellogg's Corn Flakes", "Chocos", "Oats",
+        "Parle-G", "Good Day", "Hide & Seek", "Monaco",
+        "Coca-Cola", "Pepsi", "Sprite", "Fanta", "Thums Up",
+        "Bisleri Water", "Kinley Water", "Aquafina Water",
+        "Haldiram Bhujia", "Lays Chips", "Kurkure",
+        "Amul Butter", "Amul Cheese", "Paneer",
+        "Himalaya Facewash", "Ponds Cold Cream", "Vaseline",
+        "Surf Excel Matic", "Ariel Matic", "Tide Plus",
+        "Toor Dal", "Chana Dal", "Masoor Dal", "Moong Dal",
+        "Chilli Powder", "Turmeric Powder", "Coriander Powder", "Garam Masala",
+        "Pickle Mix", "Jam Mixed Fruit", "Honey",
+    ]
+    while len(bases) < 250:
+        bases.append(f"Generic FMCG {len(bases)+1}")
+
+    size_templates = [
+        ["50g", "100g", "200g", "500g"],
+        ["100 ml", "200 ml", "500 ml", "1 L"],
+        ["250 g", "500 g", "1 kg"],
+        ["small", "medium", "large"],
+    ]
+
+    catalog = []
+    for base in bases:
+        sizes = rng.choice(size_templates)
+        desired = rng.randint(2, 4)
+        k = max(1, min(desired, len(sizes)))
+        picked_sizes = rng.sample(sizes, k=k)
+
+        for sz in picked_sizes:
+            base_price = 30 + len(base)
+            s = sz.lower()
+            factor = 1.0
+            if "50" in s: factor = 0.7
+            elif "100" in s: factor = 0.9
+            elif "200" in s: factor = 1.2
+            elif "250" in s: factor = 1.3
+            elif "500" in s: factor = 2.2
+            elif "1 kg" in s or "1 l" in s: factor = 3.8
+            elif "small" in s: factor = 0.8
+            elif "medium" in s: factor = 1.0
+            elif "large" in s: factor = 1.6
+
+            price = max(10, int(round(base_price * factor)))
+            catalog.append((f"{base} {sz}", price))
+    return catalog
+
+
+def gen_product_catalog():
+    """(sku, price) pairs. Reseeds the global random with 42, as the August demo seed expects."""
+    random.seed(42)
+    return _build_catalog(random)
+
+
+def gen_vendors(n=12):
+    names = [
+        "HUL Distributor", "Metro Cash&Carry", "VR Super Distributors", "Star Wholesale",
+        "Local Transporter", "Packaging Vendor", "Rent", "Electricity", "Cleaner",
+        "ITC Distributor", "Nestle Distributor", "PepsiCo Distributor", "Coca-Cola Distributor",
+        "Bisleri Distributor", "Tata Consumer Distributor", "Adani Wilmar Distributor",
+        "Jio Business", "Airtel Fiber",
+    ]
+    if len(names) < n:
+        for i in range(len(names)+1, n+1):
+            names.append(f"Distributor {i:02d}")
+    elif len(names) > n:
+        names = names[:n]
+    return names
+
+
+def gen_customer_pool(total_target, rng=random):
+    pool_size = max(200, int(total_target * 0.3))
+    first = ["Ramesh","Suresh","Kalyani","Anil","Sita","Ravi","Meena","Amit","Neha",
+             "Pooja","Vijay","Rekha","Sunil","Prakash","Ashok","Nitin","Deepak","Raj",
+             "Kiran","Manoj","Arun","Smita","Geeta","Nisha","Ayesha","Varun","Ishita",
+             "Rohit","Rohan","Sahil","Harish","Payal","Priya","Kartik","Yash","Ananya"]
+    last = ["Sharma","Verma","Gupta","Agarwal","Patel","Reddy","Iyer","Menon","Das",
+            "Singh","Khan","Ali","Kaul","Bose","Mehta","Jain","Kapoor","Bajaj","Chopra",
+            "Saxena","Shukla","Tripathi","Mishra","Kulkarni","Sawant","Shetty","Gowda"]
+    names, used, i = [], set(), 0
+    while len(names) < pool_size:
+        nm = f"{rng.choice(first)} {rng.choice(last)}"
+        if nm in used:
+            i += 1
+            nm = f"{nm} {i}"
+        used.add(nm)
+        names.append(nm)
+
+    s = 1.2
+    ranks = list(range(1, len(names)+1))
+    weights = [1 / (r ** s) for r in ranks]
+    total_w = sum(weights)
+    weights = [w / total_w for w in weights]
+
+    credit_eligible_count = max(1, int(0.10 * len(names)))
+    eligible_idx = set(rng.sample(range(len(names)), credit_eligible_count))
+    return names, weights, eligible_idx
+
+
+@lru_cache(maxsize=1)
+def catalog():
+    """The demo catalog, built once without touching the global random."""
+    return tuple(_build_catalog(random.Random(42)))
+
+
+# Same mix as the August seed: 85% sales (a tenth of them on credit),
+# 15% expenses (55% of those still payable). Cumulative, for random.choices.
+SALE_CREDIT, SALE_CASH, EXPENSE_PAYABLE, EXPENSE_PAID = range(4)
+KIND_CUM_WEIGHTS = (0.85 * 0.10, 0.85, 0.85 + 0.15 * 0.55, 1.0)
+EXPENSE_AMOUNTS = range(200, 2001)
+
+
+@lru_cache(maxsize=1)
+def _clock():
+    """"THH:MM:SSZ" for every second of a day, so a timestamp is one draw and a concat."""
+    return tuple(f"T{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}Z" for s in range(86400))
+
+
+def _months(start, months):
+    y, m = start.year, start.month
+    for _ in range(months):
+        yield y, m
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+
+
+def shop_rows(mobile, start, months=1, seed=0, scale=1.0):
+    """
+    Entry rows (mobile, product, units, revenue, credit, creditor, date) for
+    `months` calendar months from start's month, grouped by day.
+    Weekdays get 60-90 entries, weekends 90-120 (times `scale`); the 15th
+    is a holiday. Ready for app.write_entries.
+
+    Each day is drawn in batches: the kind of every entry first, then each
+    column for all entries of a kind at once with random.choices (a
+    cumulative-weight bisect), instead of a Python-level draw per field.
+    """
+    rng = random.Random(f"{seed}:{mobile}")
+    choices = rng.choices
+    cat, clock = catalog(), _clock()
+    vendors = gen_vendors(12)
+    customers, _, eligible = gen_customer_pool(100 * 25, rng)
+    creditors = [customers[i] for i in sorted(eligible)]
+    unpaid = {v: f"Expense: {v}" for v in vendors}
+    paid_labels = (" paid", "")
+
+    rows = []
+    for y, m in _months(start, months):
+        d = date(y, m, 1)
+        while d.month == m:
+            if d.day != 15:
+                lo, hi = (60, 90) if d.weekday() < 5 else (90, 120)
+                need = int(rng.randint(lo, hi) * scale)
+                kinds = choices(range(4), cum_weights=KIND_CUM_WEIGHTS, k=need)
+                n_credit, n_cash, n_payable, n_paid = (kinds.count(k) for k in range(4))
+                day = d.isoformat()
+                ts = iter([day + t for t in choices(clock, k=need)])
+
+                n_sales = n_credit + n_cash
+                units = choices((1, 2), k=n_sales)
+                credit = [1] * n_credit + [0] * n_cash
+                who = choices(creditors, k=n_credit) + [None] * n_cash
+                for (sku, price), u, c, w in zip(choices(cat, k=n_sales), units, credit, who):
+                    rows.append((mobile, sku, u, price * u, c, w, next(ts)))
+
+                n_exp = n_payable + n_paid
+                amounts = choices(EXPENSE_AMOUNTS, k=n_exp)
+                labels = [""] * n_payable + choices(paid_labels, cum_weights=(0.6, 1.0), k=n_paid)
+                for i, vendor in enumerate(choices(vendors, k=n_exp)):
+                    if i < n_payable:
+                        rows.append((mobile, unpaid[vendor], 1, -amounts[i], 1, vendor, next(ts)))
+                    else:
+                        rows.append((mobile, unpaid[vendor] + labels[i], 1, -amounts[i], 0, None, next(ts)))
+            d = date.fromordinal(d.toordinal() + 1)
+    return rows
@@ -0,0 +1,295 @@
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+
+# Applied to every connection the pool opens. journal_mode=WAL is persistent
+# in the database file; the rest are per-connection settings.
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),          # readers don't block on writers (and vice versa)
+    ("synchronous", "NORMAL"),        # fsync on checkpoint, not on every commit (safe with WAL)
+    ("cache_size", -32000),           # ~32 MB page cache per connection (negative = KiB)
+    ("mmap_size", 256 * 1024 * 1024), # read through the OS page cache instead of read() calls
+    ("busy_timeout", 5000),           # wait up to 5s for a competing writer instead of erroring
+    ("temp_store", "MEMORY"),
+)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Reports each execute/executemany/executescript to `observe(sql, seconds)`.
+    Time is until the statement's first step: all of a write or an
+    aggregate, not rows a caller fetches lazily afterwards.
+    """
+
+    observe = None
+
+    def execute(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            self.observe(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            self.observe(sql, time.perf_counter() - t0)
+
+    def executescript(self, sql):
+        t0 = time.perf_counter()
+        try:
+            return super().executescript(sql)
+        finally:
+            self.observe("<script>", time.perf_counter() - t0)
+
+
+def connect(path, pragmas=SQLITE_PRAGMAS, observe=None):
+    """A configured connection: Row results, `pragmas` applied, timed if observe is set."""
+    if observe is None:
+        conn = sqlite3.connect(path, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False, factory=TimedConnection)
+        conn.observe = observe
+    conn.row_factory = sqlite3.Row
+    for name, value in pragmas:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class _Held:
+    """A per-thread connection, reachable only from that thread's locals (see _hold)."""
+
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+def _close_owned(conn, pid):
+    # a forked child inherits the parent's handles but must not close them
+    if os.getpid() == pid:
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            pass
+
+
+def _hold(conn):
+    """
+    Wrap a per-thread connection so it is closed when the thread exits and
+    its locals (the only reference to the wrapper) are freed -- straight
+    away, not whenever the cycle collector gets to the connection.
+    """
+    held = _Held(conn)
+    weakref.finalize(held, _close_owned, conn, os.getpid())
+    return held
+
+
+class ConnectionPool:
+    """
+    Per-thread reusable SQLite connections.
+
+    Each worker thread gets one long-lived connection, opened and configured
+    on first use and handed back on every later request, so requests don't pay
+    for connect + pragma setup. A connection is closed when its thread exits
+    (the threaded dev server starts one per client connection), and re-opened
+    after a fork (gunicorn --preload) since SQLite handles must not cross
+    processes.
+    """
+
+    def __init__(self, path, pragmas=SQLITE_PRAGMAS, observe=None):
+        self.path = path
+        self.pragmas = tuple(pragmas)
+        self.observe = observe  # observe(sql, seconds) for every statement, if set
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._held = weakref.WeakSet()  # live threads' connections, for close_all()
+        self._pid = os.getpid()
+        # Persistent settings (WAL) are switched once, up front.
+        conn = self._open()
+        self._register(conn)
+
+    def _open(self):
+        return connect(self.path, self.pragmas, self.observe)
+
+    def _register(self, conn):
+        held = _hold(conn)
+        self._local.held = held
+        self._local.pid = os.getpid()
+        with self._lock:
+            self._held.add(held)
+
+    def connection(self):
+        """The calling thread's connection (opened on first use)."""
+        held = getattr(self._local, "held", None)
+        if held is None or self._local.pid != os.getpid():
+            if self._pid != os.getpid():
+                # forked: forget the parent's handles without closing them
+                with self._lock:
+                    self._held = weakref.WeakSet()
+                self._pid = os.getpid()
+            conn = self._open()
+            self._register(conn)
+            return conn
+        return held.conn
+
+    def release(self, conn):
+        """End-of-request hook: drop any transaction the request left open."""
+        if conn.in_transaction:
+            conn.rollback()
+
+    def open_count(self):
+        """Connections held by live threads of this process."""
+        with self._lock:
+            return len(self._held)
+
+    def close_all(self):
+        with self._lock:
+            held, self._held = list(self._held), weakref.WeakSet()
+        for h in held:
+            _close_owned(h.conn, os.getpid())
+        self._local = threading.local()
+
+
+class ShardSet:
+    """
+    Ledgers split by mobile over `count` SQLite files, so one shop's write
+    lock only stalls the shops that share its file.
+
+    Shard 0 is the main database (main_pool), which also keeps the
+    shard_catalog table; shards 1..count-1 sit beside it as
+    ledger.shard<k>.db. With count=1 everything stays in the main file.
+    A mobile's shard is chosen once (crc32 of the mobile) and recorded in
+    the catalog, so growing `count` later only places new shops on the
+    new files. Callers pin existing tenants with pin().
+
+    Each thread keeps its own connections to shards 1.. and at most
+    `max_open` of them between requests: past that, release() closes the
+    least recently used ones without an open transaction. A request that
+    touches more shards keeps all of their handles until it ends.
+    """
+
+    def __init__(self, main_pool, count=1, max_open=16):
+        self.main = main_pool
+        self.count = max(1, count)
+        self.max_open = max(1, max_open)
+        root, ext = os.path.splitext(main_pool.path)
+        self.paths = [main_pool.path] + [f"{root}.shard{k}{ext}" for k in range(1, self.count)]
+        self._catalog = {}  # mobile -> shard, as recorded in shard_catalog
+        self._catalog_conn = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._opened = 0  # shard connections opened / closed for max_open, by this process
+        self._evicted = 0
+
+    def create_catalog(self, db):
+        """Create shard_catalog in the main database; refuses a count below a shard already in use."""
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS shard_catalog ("
+            " mobile TEXT PRIMARY KEY,"
+            " shard  INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        db.commit()
+        top = db.execute("SELECT MAX(shard) FROM shard_catalog").fetchone()[0]
+        if top is not None and top >= self.count:
+            raise RuntimeError(f"shard_catalog has shops on shard {top}; need at least {top + 1} shards")
+
+    def _catalog_db(self):
+        # Own autocommit connection: assigning a shard must not commit (or
+        # wait on) whatever transaction the calling request has open.
+        if self._catalog_conn is None or self._pid != os.getpid():
+            self._catalog_conn = connect(self.main.path, self.main.pragmas)
+            self._catalog_conn.isolation_level = None
+            self._pid = os.getpid()
+        return self._catalog_conn
+
+    def shard_for(self, mobile, assign=True):
+        """
+        The shard holding `mobile`, assigning (and recording) one on first
+        sight. With assign=False (read paths) an unrecorded mobile gets the
+        shard it would be assigned, without writing to the catalog.
+        """
+        if self.count == 1:
+            return 0
+        k = self._catalog.get(mobile)
+        if k is not None:
+            return k
+        with self._lock:
+            db = self._catalog_db()
+            if assign:
+                db.execute("INSERT OR IGNORE INTO shard_catalog (mobile, shard) VALUES (?, ?)",
+                           (mobile, zlib.crc32(mobile.encode()) % self.count))
+            # another worker may have got there first: the catalog row wins
+            row = db.execute("SELECT shard FROM shard_catalog WHERE mobile = ?", (mobile,)).fetchone()
+            if row is None:
+                return zlib.crc32(mobile.encode()) % self.count
+            k = self._catalog[mobile] = row[0]
+        return k
+
+    def pin(self, mobiles, shard=0):
+        """Record mobiles without a catalog row as living on `shard`; returns how many were new."""
+        if self.count == 1:
+            return 0
+        with self._lock:
+            db = self._catalog_db()
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO shard_catalog (mobile, shard) VALUES (?, ?)",
+                           [(m, shard) for m in mobiles])
+            return db.total_changes - before
+
+    def _cache(self):
+        cache = getattr(self._local, "conns", None)
+        if cache is None or self._local.pid != os.getpid():
+            cache = self._local.conns = OrderedDict()
+            self._local.pid = os.getpid()
+        return cache
+
+    def connection(self, k):
+        """The calling thread's connection to shard k (opened on first use)."""
+        if k == 0:
+            return self.main.connection()
+        cache = self._cache()
+        held = cache.get(k)
+        if held is not None:
+            cache.move_to_end(k)
+            return held.conn
+        conn = connect(self.paths[k], self.main.pragmas, self.main.observe)
+        cache[k] = _hold(conn)
+        with self._lock:
+            self._opened += 1
+        return conn
+
+    def release(self, k):
+        """
+        End-of-request hook for shard k: drop any transaction left open, then
+        close this thread's least recently used handles past max_open.
+        """
+        cache = self._cache()
+        if k == 0:
+            self.main.release(self.main.connection())
+        elif k in cache:
+            self.main.release(cache[k].conn)
+        # never a handle mid-transaction: its own release() is still to come
+        idle = [j for j, h in cache.items() if not h.conn.in_transaction]
+        for j in idle[:max(0, len(cache) - self.max_open)]:
+            cache.pop(j).conn.close()
+            with self._lock:
+                self._evicted += 1
+
+    def each(self):
+        """(k, connection) for every shard, in order; for admin and maintenance fan-out."""
+        for k in range(self.count):
+            yield k, self.connection(k)
+
+    def stats(self):
+        with self._lock:
+            return {"shards": self.count, "max_open": self.max_open,
+                    "opened": self._opened, "evicted": self._evicted}